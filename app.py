@@ -4,13 +4,28 @@ from streamlit_folium import st_folium
 import numpy as np
 import os
 import re
+import base64
+import json
 import time
 import pandas as pd
 from pyproj import Transformer
 import geopandas as gpd
-from folium.plugins import Fullscreen
+import shapely
+from folium.plugins import Fullscreen, Draw, TimestampedGeoJson
 from folium import MacroElement
 from jinja2 import Template
+from mobility_data import (
+    JUNCTION_TYPE_LABELS, TRAFFIC_CONTROL_TYPE_LABELS, TRAFFIC_CALMING_ASSETCODE_LABELS, LIGHTUSE_LABELS,
+    COLLISION_CHARACTERISTIC_FILTERS, get_available_collision_years,
+    read_junctions_shapefile, read_traffic_controls_shapefile, read_traffic_calming_shapefile,
+    read_street_lights_shapefile, read_centrelines_shapefile, read_all_traffic_collisions,
+    filter_junctions, filter_traffic_controls, filter_traffic_calming, filter_street_lights,
+    filter_traffic_collisions, filter_centrelines,
+    drop_missing_geometries, optional_column, factorize_column,
+    COLLISION_CHARACTERISTIC_LABELS, collision_characteristic_bitmask, count_bitmask_bits,
+    StreetSearchIndex, zoom_for_bounds, AreaStatisticsIndex, CollisionTimeline, playback_frame_starts, CollisionCube,
+    STREET_PROXIMITY_METERS, COLLISION_CUBE_DIMENSIONS,
+)
 
 # Streamlit page configuration
 st.set_page_config(page_title="Halifax Urban Mobility Data Viewer", layout="wide")
@@ -45,66 +60,19 @@ class AppSessionStateKeys:
     SELECTED_CENTRELINE_ST_CLASS = 'selected_centreline_st_class'
     LAST_RENDERED_CENTRELINE_ST_CLASS = 'last_rendered_centreline_class'
     ACTIVE_BASEMAP = 'active_basemap'
+    CLIENT_SIDE_FILTERING = 'client_side_filtering'
+    STREET_SEARCH_QUERY = 'street_search_query'
+    ACTIVE_STREET = 'active_street'
+    RESTRICT_TO_STREET = 'restrict_to_street'
+    AREA_SELECTION = 'area_selection'
+    LAST_SEEN_DRAWING = 'last_seen_drawing'
+    SELECTED_COLLISION_DATE_RANGE = 'selected_collision_date_range'
+    LAST_RENDERED_COLLISION_DATE_RANGE = 'last_rendered_collision_date_range'
+    SELECTED_COLLISION_PLAYBACK = 'selected_collision_playback'
+    LAST_RENDERED_COLLISION_PLAYBACK = 'last_rendered_collision_playback'
 
-# --- Label dictionaries for UI and popups ---
-JUNCTION_TYPE_LABELS = {
-    0: "Non‐Intersection Junction",
-    1: "Intersection",
-    2: "Dead End",
-    3: "Ferry Route Connection",
-    4: "Outer Boundary Point",
-    5: "Boulevard"
-}
-TRAFFIC_CONTROL_TYPE_LABELS = {
-    1: "Intersection",
-    6: "Signalized Intersection",
-    7: "RA‐5 with Flashing Beacon",
-    8: "Overhead Flashing Beacon",
-    9: "RA‐5 without Flashing Beacon",
-    10: "Rectangular Rapid Flashing Beacon",
-    11: "Roundabout",
-    12: "Lane Control",
-    13: "All Way Stop",
-    14: "Pedestrian Half Signals",
-    15: "Median Mounted Flashing Beacon"
-}
-TRAFFIC_CALMING_ASSETCODE_LABELS = {
-    "SPDHMP": "Speed Humps",
-    "SPDTBL": "Speed Tables",
-    "RSDINT": "Raised Intersections",
-    "RSDCRW": "Raised Crosswalks",
-    "SPDCSH": "Speed Cushions",
-    "BMPOUT": "Concrete curb variations: Bump-outs",
-    "CTRMED": "Concrete curb variations: Centre Island Medians",
-    "CHICAN": "Concrete curb variations: Chicanes",
-    "BUSPTF": "Bus Platforms",
-    "BUSBMP": "Bus Stop Bump Outs / Bus Bulb",
-    "TRFCIR": "Traffic Circle"
-}
-
-LIGHTUSE_LABELS = {
-    "ROW": "ROW Street Light",
-    "PRIV": "Private Light",
-    "AREA": "Area Light",
-    "FLOOD": "Flood Light",
-    "PARK": "Park Light",
-    "PARKING": "Parking Lot Light",
-    "WALKWAY": "Walkway Light",
-    "BOARDWALK": "Boardwalk Light"
-}
-
-# --- Collision characteristic filter keys and their column names ---
-COLLISION_CHARACTERISTIC_FILTERS = {
-    'non_fatal': 'NON_FATAL_',
-    'fatal_injury': 'FATAL_INJU',
-    'young_driver': 'YOUNG_DEMO',
-    'pedestrian_involved': 'PEDESTRIAN',
-    'aggressive_driving': 'AGRESSIVE_',
-    'distracted_driving': 'DISTRACTED',
-    'impaired_driving': 'IMPAIRED_D',
-    'bicycle_collision': 'BICYCLE_CO',
-    'intersection_related': 'INTERSECTI'
-}
+DEFAULT_MAP_CENTER = [44.649605, -63.592300]
+DEFAULT_MAP_ZOOM = 13
 
 # --- Helper function for generating filter controls ---
 def generate_filter_control(label_text, label_color, options_list, format_func, 
@@ -134,78 +102,37 @@ def generate_filter_control(label_text, label_color, options_list, format_func,
         )
         st.session_state[session_state_key_selected_values] = selected_values
 
-# --- Helper function for adding generic point layers to map ---
-def add_generic_point_layer(map_object, data_gdf, layer_name_prefix, color, radius,
-                            tooltip_popup_generator_func, unique_filter_tuple_for_name, show_layer=True):
+# --- Helper function for collecting point layers for the canvas renderer ---
+def add_point_layer_payload(layer_payloads, data_gdf, payload_builder):
     """
-    Adds a generic point-based feature layer to the Folium map.
+    Encodes a filtered point dataset for its FastPointLayer and returns its feature count.
     """
-    if not data_gdf.empty:
-        count = len(data_gdf)
-        feature_group_name_parts = [layer_name_prefix] + list(map(str, unique_filter_tuple_for_name))
-        feature_group_name = "_".join(filter(None, feature_group_name_parts))
-        
-        fg = folium.FeatureGroup(name=feature_group_name, show=show_layer)
-        for _, row in data_gdf.iterrows():
-            popup_text = tooltip_popup_generator_func(row)
-            folium.CircleMarker(
-                location=[row.geometry.y, row.geometry.x],
-                radius=radius,
-                color=color,
-                fill=True,
-                fill_color=color,
-                tooltip=popup_text
-            ).add_to(fg)
-        fg.add_to(map_object)
-        return count
-    return 0
+    if data_gdf.empty:
+        return 0
+    payload = payload_builder(data_gdf)
+    layer_payloads.append(payload)
+    return payload['count']
 
 # --- Data loading and caching functions for all datasets ---
 @st.cache_resource(show_spinner=True)
 def load_junctions_shapefile():
-    gdf = gpd.read_file("Street junctions/Street_Junctions_trimmed.shp")
-    if gdf.crs and gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    return gdf
+    return read_junctions_shapefile()
 
 @st.cache_resource(show_spinner=True)
 def load_traffic_controls_shapefile():
-    gdf = gpd.read_file("traffic control locations/Traffic_Control_Locations_trimmed.shp")
-    if gdf.crs and gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    return gdf
+    return read_traffic_controls_shapefile()
 
 @st.cache_resource(show_spinner=True)
 def load_traffic_calming_shapefile():
-    gdf = gpd.read_file("Traffic calming infrastructure/Traffic_Calming_Infrastructure_trimmed.shp")
-    if gdf.crs and gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    return gdf
+    return read_traffic_calming_shapefile()
 
 @st.cache_resource(show_spinner=True)
 def load_street_lights_shapefile():
-    gdf = gpd.read_file("streetlights/Street_Lights_trimmed.shp")
-    if gdf.crs and gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    for col in ['LIGHTUSE', 'MAT', 'SETBACK']:
-        if col in gdf.columns:
-            gdf[col] = gdf[col].replace('', 'UNKN').fillna('UNKN')
-    return gdf
+    return read_street_lights_shapefile()
 
 @st.cache_resource(show_spinner=True)
 def load_centrelines_shapefile():
-    gdf = gpd.read_file("street centrelines/Street_Network_trimmed.shp")
-    gdf.columns = [col.lower() for col in gdf.columns]
-    # Project to UTM zone 20N (EPSG:26920) for accurate length in meters
-    gdf_metric = gdf.to_crs(epsg=26920)
-    gdf['length_m'] = gdf_metric.length
-    # Back to WGS84 for Folium
-    if gdf.crs and gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs(epsg=4326)
-    bins = [0, 56, 90, 117, 150, 195, 251, 331, 450, 708, 42587]
-    labels = [f"{bins[i]+1}–{bins[i+1]}m" for i in range(10)]
-    gdf['length_bucket'] = pd.cut(gdf['length_m'], bins=bins, labels=labels, include_lowest=True, right=True)
-    return gdf
+    return read_centrelines_shapefile()
 
 # --- Load all datasets globally and cache them ---
 load_start = time.time()
@@ -216,23 +143,7 @@ traffic_calming_gdf = load_traffic_calming_shapefile()
 centrelines_gdf = load_centrelines_shapefile()
 load_end = time.time()
 
-# --- Collision data: available years and loading by year ---
-def get_available_collision_years():
-    folder = "traffic_collisions_by_year"
-    years = []
-    if not os.path.exists(folder) or not os.path.isdir(folder):
-        return years
-    for fname in os.listdir(folder):
-        if fname.startswith("collisions_") and fname.endswith(".shp"):
-            try:
-                year_str = fname.replace("collisions_", "").replace(".shp", "")
-                if year_str.isdigit():
-                    years.append(int(year_str))
-            except ValueError:
-                pass
-    years.sort()
-    return years
-
+# --- Collision data: counts and loading by year ---
 @st.cache_data
 def get_all_collision_year_counts():
     counts = {}
@@ -277,9 +188,13 @@ def get_all_collision_characteristic_counts():
         if column_name in combined_gdf.columns:
             count = combined_gdf[column_name].fillna('N').astype(str).str.upper().isin(['Y', 'YES']).sum()
             counts[key] = int(count)
-            
+
     return counts
 
+@st.cache_resource(show_spinner=True)
+def load_all_traffic_collisions():
+    return read_all_traffic_collisions()
+
 # --- Session state initialization for all controls and filters ---
 def initialize_session_state():
     defaults = {
@@ -291,8 +206,8 @@ def initialize_session_state():
         AppSessionStateKeys.SELECTED_STREET_LIGHT_USES: [],
         AppSessionStateKeys.SELECTED_STREET_LIGHT_MATERIALS: [],
         AppSessionStateKeys.SHOW_ALL_SELECTED_FEATURES: False,
-        AppSessionStateKeys.MAP_ZOOM: 13,
-        AppSessionStateKeys.MAP_CENTER: [44.649605, -63.592300],
+        AppSessionStateKeys.MAP_ZOOM: DEFAULT_MAP_ZOOM,
+        AppSessionStateKeys.MAP_CENTER: DEFAULT_MAP_CENTER,
         AppSessionStateKeys.TOTAL_CHARACTERISTIC_COUNTS: {},
         # --- Add last rendered keys ---
         AppSessionStateKeys.LAST_RENDERED_JUNCTION_TYPES: [],
@@ -308,6 +223,15 @@ def initialize_session_state():
         AppSessionStateKeys.SELECTED_CENTRELINE_ST_CLASS: [],
         AppSessionStateKeys.LAST_RENDERED_CENTRELINE_ST_CLASS: [],
         AppSessionStateKeys.ACTIVE_BASEMAP: "OpenStreetMap",
+        AppSessionStateKeys.CLIENT_SIDE_FILTERING: False,
+        AppSessionStateKeys.ACTIVE_STREET: None,
+        AppSessionStateKeys.RESTRICT_TO_STREET: False,
+        AppSessionStateKeys.AREA_SELECTION: None,
+        AppSessionStateKeys.LAST_SEEN_DRAWING: None,
+        AppSessionStateKeys.SELECTED_COLLISION_DATE_RANGE: None,
+        AppSessionStateKeys.LAST_RENDERED_COLLISION_DATE_RANGE: None,
+        AppSessionStateKeys.SELECTED_COLLISION_PLAYBACK: "Off",
+        AppSessionStateKeys.LAST_RENDERED_COLLISION_PLAYBACK: "Off",
     }
     for key, val in defaults.items():
         if key not in st.session_state:
@@ -324,106 +248,708 @@ initialize_session_state()
 # --- Cached filter functions for each dataset ---
 @st.cache_data
 def get_filtered_junction_data(selected_junction_types_tuple):
-    if not selected_junction_types_tuple:
-        return gpd.GeoDataFrame()
-    return junctions_gdf[junctions_gdf['JUNCTION_T'].isin(selected_junction_types_tuple)]
+    return filter_junctions(junctions_gdf, selected_junction_types_tuple)
 
 @st.cache_data
 def get_filtered_traffic_controls_data(selected_traffic_control_types_tuple):
-    if not selected_traffic_control_types_tuple or 'CONTROL_TY' not in traffic_controls_gdf.columns:
-        return gpd.GeoDataFrame()
-    return traffic_controls_gdf[traffic_controls_gdf['CONTROL_TY'].isin(selected_traffic_control_types_tuple)]
+    return filter_traffic_controls(traffic_controls_gdf, selected_traffic_control_types_tuple)
 
 @st.cache_data
 def get_filtered_traffic_calming_data(selected_asset_codes_tuple):
-    if not selected_asset_codes_tuple or 'ASSETCODE' not in traffic_calming_gdf.columns:
-        return gpd.GeoDataFrame()
-    return traffic_calming_gdf[traffic_calming_gdf['ASSETCODE'].isin(selected_asset_codes_tuple)]
+    return filter_traffic_calming(traffic_calming_gdf, selected_asset_codes_tuple)
 
 @st.cache_data
 def get_filtered_street_lights_data(selected_lightuse_tuple, selected_material_tuple):
-    if not selected_lightuse_tuple and not selected_material_tuple:
-        return gpd.GeoDataFrame()
-    
-    data_to_filter = street_lights_gdf
-
-    if selected_lightuse_tuple:
-        if 'LIGHTUSE' not in data_to_filter.columns: return gpd.GeoDataFrame()
-        data_to_filter = data_to_filter[data_to_filter['LIGHTUSE'].isin(selected_lightuse_tuple)]
-    
-    if selected_material_tuple:
-        if 'MAT' not in data_to_filter.columns: return gpd.GeoDataFrame()
-        data_to_filter = data_to_filter[data_to_filter['MAT'].isin(selected_material_tuple)]
-
-    return data_to_filter
+    return filter_street_lights(street_lights_gdf, selected_lightuse_tuple, selected_material_tuple)
 
 @st.cache_data
 def get_filtered_traffic_collisions_data(selected_years_tuple, active_boolean_filters):
-    current_data_frames = []
-    base_data_loaded = False
-    if selected_years_tuple:
-        for year in selected_years_tuple:
-            path = os.path.join("traffic_collisions_by_year", f"collisions_{year}.shp")
-            if os.path.exists(path):
-                try:
-                    df = gpd.read_file(path)
-                    if 'Year' not in df.columns and 'ACCIDENT_D' in df.columns:
-                        df['Year'] = pd.to_datetime(df['ACCIDENT_D'], errors='coerce').dt.year
-                        df.dropna(subset=['Year'], inplace=True)
-                        df['Year'] = df['Year'].astype(int)
-                    current_data_frames.append(df)
-                except Exception:
-                    pass
-        if current_data_frames:
-            base_data_loaded = True
-    elif any(active_boolean_filters.values()):
-        for year in get_available_collision_years():
-            path = os.path.join("traffic_collisions_by_year", f"collisions_{year}.shp")
-            if os.path.exists(path):
-                try:
-                    df = gpd.read_file(path)
-                    if 'Year' not in df.columns and 'ACCIDENT_D' in df.columns:
-                        df['Year'] = pd.to_datetime(df['ACCIDENT_D'], errors='coerce').dt.year
-                        df.dropna(subset=['Year'], inplace=True)
-                        df['Year'] = df['Year'].astype(int)
-                    current_data_frames.append(df)
-                except Exception:
-                    pass
-        if current_data_frames:
-            base_data_loaded = True
-    if not base_data_loaded:
-        return gpd.GeoDataFrame()
-    final_data = gpd.GeoDataFrame(pd.concat(current_data_frames, ignore_index=True)) if current_data_frames else gpd.GeoDataFrame()
-    if final_data.empty:
-        return gpd.GeoDataFrame()
-    if any(active_boolean_filters.values()):
-        for filter_key, column_name in COLLISION_CHARACTERISTIC_FILTERS.items():
-            if active_boolean_filters.get(filter_key, False):
-                if column_name in final_data.columns:
-                    condition = final_data[column_name].fillna('N').astype(str).str.upper().isin(['Y', 'YES'])
-                    final_data = final_data[condition]
-                    if final_data.empty:
-                        return gpd.GeoDataFrame()
-    return final_data
+    return filter_traffic_collisions(selected_years_tuple, active_boolean_filters)
 
 @st.cache_data
 def get_filtered_centrelines_data(selected_buckets_tuple, selected_st_class_tuple):
-    if not selected_buckets_tuple and not selected_st_class_tuple:
-        return gpd.GeoDataFrame()
-    
-    # Initial data to filter
-    data_to_filter = centrelines_gdf
+    return filter_centrelines(centrelines_gdf, selected_buckets_tuple, selected_st_class_tuple)
 
-    # Apply filters if they are provided
-    if selected_buckets_tuple:
-        if 'length_bucket' not in data_to_filter.columns: return gpd.GeoDataFrame()
-        data_to_filter = data_to_filter[data_to_filter['length_bucket'].isin(selected_buckets_tuple)]
-    
-    if selected_st_class_tuple:
-        if 'st_class' not in data_to_filter.columns: return gpd.GeoDataFrame()
-        data_to_filter = data_to_filter[data_to_filter['st_class'].isin(selected_st_class_tuple)]
+# --- Compact payload encoding for client-side filtering ---
+MISSING_DATE_DAYS = np.iinfo(np.int32).min
+
+def encode_typed_array(values, dtype):
+    """
+    Encodes a numeric array as base64 little-endian bytes, decoded in the browser as a typed array.
+    """
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode('ascii')
+
+def encode_coded_column(series, label_func=str):
+    """
+    Encodes a categorical column as integer codes plus a label table and per-code counts.
+    """
+    codes, uniques = factorize_column(series)
+    if len(uniques) <= 0xFF:
+        dtype, js_dtype = '<u1', 'uint8'
+    elif len(uniques) <= 0xFFFF:
+        dtype, js_dtype = '<u2', 'uint16'
+    else:
+        dtype, js_dtype = '<u4', 'uint32'
+    return {
+        'kind': 'coded',
+        'dtype': js_dtype,
+        'data': encode_typed_array(codes, dtype),
+        'labels': [label_func(value) for value in uniques],
+        'counts': np.bincount(codes, minlength=len(uniques)).tolist(),
+    }
+
+def encode_characteristic_bitmask(gdf):
+    mask = collision_characteristic_bitmask(gdf)
+    return {
+        'kind': 'bits',
+        'dtype': 'uint16',
+        'data': encode_typed_array(mask, '<u2'),
+        'labels': COLLISION_CHARACTERISTIC_LABELS,
+        'counts': count_bitmask_bits(mask, len(COLLISION_CHARACTERISTIC_LABELS)),
+    }
+
+def encode_date_column(series):
+    """
+    Encodes dates as int32 days since 1970-01-01, with the int32 minimum marking missing values.
+    """
+    dates = pd.to_datetime(series, errors='coerce')
+    days = (dates - pd.Timestamp('1970-01-01')).dt.days.fillna(MISSING_DATE_DAYS)
+    return {'kind': 'date', 'dtype': 'int32', 'data': encode_typed_array(days, '<i4')}
+
+def encode_number_column(series, decimals=0, suffix=''):
+    return {
+        'kind': 'number',
+        'dtype': 'float32',
+        'data': encode_typed_array(pd.to_numeric(series, errors='coerce'), '<f4'),
+        'decimals': decimals,
+        'suffix': suffix,
+    }
+
+def build_client_dataset_payload(gdf, name, color, radius, columns, filters, tooltip):
+    """
+    Builds the browser payload for one dataset: interleaved float32 lat/lon coordinates,
+    encoded attribute columns, the filter controls to expose and the tooltip fields.
+    Line datasets also carry uint32 vertex offsets, one entry per line plus a terminator.
+    """
+    payload = {
+        'name': name,
+        'color': color,
+        'radius': radius,
+        'columns': columns,
+        'filters': [{'column': column, 'label': label, 'color': label_color} for column, label, label_color in filters],
+        'tooltip': tooltip,
+    }
+    if gdf.empty or gdf.geometry.geom_type.iloc[0] == 'Point':
+        coords = np.column_stack([gdf.geometry.y.to_numpy(), gdf.geometry.x.to_numpy()])
+        payload['coords'] = encode_typed_array(coords.ravel(), '<f4')
+    else:
+        vertex_arrays = [np.asarray(geom.coords)[:, ::-1] for geom in gdf.geometry]
+        offsets = np.concatenate([[0], np.cumsum([len(v) for v in vertex_arrays])])
+        payload['coords'] = encode_typed_array(np.concatenate(vertex_arrays).ravel(), '<f4')
+        payload['offsets'] = encode_typed_array(offsets, '<u4')
+    payload['count'] = len(gdf)
+    return payload
+
+def encode_payload_json(datasets):
+    # Escape "</" so labels can never close the surrounding <script> tag
+    return json.dumps(datasets).replace('</', '<\\/')
+
+# --- Per-dataset payload builders (shared by the client-side and server-side renderers) ---
+def build_junctions_payload(gdf):
+    gdf = drop_missing_geometries(gdf)
+    return build_client_dataset_payload(
+        gdf, "Junctions", 'blue', 5,
+        {'JUNCTION_T': encode_coded_column(gdf['JUNCTION_T'], lambda x: JUNCTION_TYPE_LABELS.get(x, f"Unknown Type {x}"))},
+        [('JUNCTION_T', "Junctions", "#1976d2")],
+        [("Junction Type", 'JUNCTION_T')]
+    )
+
+def build_traffic_controls_payload(gdf):
+    gdf = drop_missing_geometries(gdf)
+    return build_client_dataset_payload(
+        gdf, "Traffic Controls", 'red', 4,
+        {'CONTROL_TY': encode_coded_column(gdf['CONTROL_TY'], lambda x: TRAFFIC_CONTROL_TYPE_LABELS.get(x, f"Unknown Type {x}"))},
+        [('CONTROL_TY', "Traffic Controls", "#d32f2f")],
+        [("Control Type", 'CONTROL_TY')]
+    )
+
+def build_collisions_payload(gdf):
+    gdf = drop_missing_geometries(gdf)
+    columns = {
+        'Year': encode_coded_column(optional_column(gdf, 'Year')),
+        'characteristics': encode_characteristic_bitmask(gdf),
+    }
+    tooltip = [("Year", 'Year')]
+    if 'ACCIDENT_D' in gdf.columns:
+        columns['ACCIDENT_D'] = encode_date_column(gdf['ACCIDENT_D'])
+        tooltip.append(("Date", 'ACCIDENT_D'))
+    tooltip.append((None, 'characteristics'))
+    return build_client_dataset_payload(
+        gdf, "Collisions", 'orange', 3, columns,
+        [('Year', "Collisions (year)", "#ff9800"), ('characteristics', "Collisions (type)", "#ff9800")],
+        tooltip
+    )
+
+def build_traffic_calming_payload(gdf):
+    gdf = drop_missing_geometries(gdf)
+    return build_client_dataset_payload(
+        gdf, "Traffic Calming", 'teal', 3,
+        {
+            'ASSETCODE': encode_coded_column(gdf['ASSETCODE'], lambda x: TRAFFIC_CALMING_ASSETCODE_LABELS.get(x, x)),
+            'INSTYR': encode_coded_column(optional_column(gdf, 'INSTYR')),
+            'LOCATION': encode_coded_column(optional_column(gdf, 'LOCATION')),
+        },
+        [('ASSETCODE', "Traffic Calming", "#008080")],
+        [("Type", 'ASSETCODE'), ("Install Year", 'INSTYR'), ("Location", 'LOCATION')]
+    )
+
+def build_street_lights_payload(gdf):
+    gdf = drop_missing_geometries(gdf)
+    return build_client_dataset_payload(
+        gdf, "Street Lights", '#DAA520', 2.5,
+        {
+            'LIGHTUSE': encode_coded_column(gdf['LIGHTUSE'], lambda x: LIGHTUSE_LABELS.get(x, x)),
+            'MAT': encode_coded_column(gdf['MAT']),
+            'SETBACK': encode_coded_column(optional_column(gdf, 'SETBACK')),
+            'INSTYR': encode_coded_column(optional_column(gdf, 'INSTYR')),
+        },
+        [('LIGHTUSE', "Street Lights (Use)", "#DAA520"), ('MAT', "Street Lights (Material)", "#DAA520")],
+        [("Material", 'MAT'), ("Use", 'LIGHTUSE'), ("Setback", 'SETBACK'), ("Install Year", 'INSTYR')]
+    )
+
+def build_centrelines_payload(gdf):
+    gdf = drop_missing_geometries(gdf)
+    gdf = gdf[gdf.geometry.geom_type.isin(['LineString', 'MultiLineString'])].explode(index_parts=False)
+    columns = {
+        'length_bucket': encode_coded_column(gdf['length_bucket']),
+        'full_name': encode_coded_column(optional_column(gdf, 'full_name')),
+        'from_str': encode_coded_column(optional_column(gdf, 'from_str')),
+        'to_str': encode_coded_column(optional_column(gdf, 'to_str')),
+        'length_m': encode_number_column(gdf['length_m'], decimals=1, suffix='m'),
+    }
+    filters = [('length_bucket', "Street Segments (Length)", "#1565c0")]
+    if 'st_class' in gdf.columns:
+        columns['st_class'] = encode_coded_column(gdf['st_class'])
+        filters.append(('st_class', "Street Segments (Classification)", "#1565c0"))
+    return build_client_dataset_payload(
+        gdf, "Street Centrelines", '#444', 4, columns, filters,
+        [("Name", 'full_name'), ("From", 'from_str'), ("To", 'to_str'), ("Class", 'st_class'), ("Length", 'length_m')]
+    )
+
+@st.cache_resource(show_spinner="Preparing client-side data...")
+def get_client_side_payload_json():
+    """
+    Encodes every dataset once for the ClientSideFilterLayer and returns it as a JSON string.
+    """
+    datasets = [build_junctions_payload(junctions_gdf)]
+    if 'CONTROL_TY' in traffic_controls_gdf.columns:
+        datasets.append(build_traffic_controls_payload(traffic_controls_gdf))
+    all_collisions = load_all_traffic_collisions()
+    if not all_collisions.empty:
+        datasets.append(build_collisions_payload(all_collisions))
+    if not traffic_calming_gdf.empty and 'ASSETCODE' in traffic_calming_gdf.columns:
+        datasets.append(build_traffic_calming_payload(traffic_calming_gdf))
+    if not street_lights_gdf.empty and 'LIGHTUSE' in street_lights_gdf.columns and 'MAT' in street_lights_gdf.columns:
+        datasets.append(build_street_lights_payload(street_lights_gdf))
+    datasets.append(build_centrelines_payload(centrelines_gdf))
+    return encode_payload_json(datasets)
+
+# --- Shared browser-side helpers for the custom map elements ---
+# Emitted once per map by MobilityViewerScript; decodes payloads, formats tooltips and provides L.Layer-based
+# FastPointLayer, which draws points on a canvas from projected float coordinates and a
+# per-point style index, and hit-tests them through a screen-space grid for tooltips.
+MOBILITY_VIEWER_JS = Template(u"""
+window.mobilityViewer = window.mobilityViewer || (function() {
+    var MISSING_DATE = {{ missing_date }};
+    var arrayTypes = {
+        'uint8': Uint8Array, 'uint16': Uint16Array, 'uint32': Uint32Array,
+        'int32': Int32Array, 'float32': Float32Array
+    };
+
+    function decode(b64, dtype) {
+        var binary = atob(b64);
+        var bytes = new Uint8Array(binary.length);
+        for (var i = 0; i < binary.length; i++) { bytes[i] = binary.charCodeAt(i); }
+        return new arrayTypes[dtype](bytes.buffer);
+    }
+
+    function decodeDataset(ds) {
+        if (ds.decoded) { return ds; }
+        ds.coords = decode(ds.coords, 'float32');
+        if (ds.offsets) { ds.offsets = decode(ds.offsets, 'uint32'); }
+        Object.keys(ds.columns).forEach(function(name) {
+            var column = ds.columns[name];
+            column.values = decode(column.data, column.dtype);
+            delete column.data;
+        });
+        ds.decoded = true;
+        return ds;
+    }
+
+    function escapeHtml(text) {
+        return String(text).replace(/[&<>"']/g, function(c) {
+            return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+        });
+    }
+
+    function formatValue(column, i) {
+        var value = column.values[i];
+        if (column.kind === 'coded') { return column.labels[value]; }
+        if (column.kind === 'bits') {
+            var names = [];
+            for (var b = 0; b < column.labels.length; b++) {
+                if (value & (1 << b)) { names.push(column.labels[b]); }
+            }
+            return names.join(', ');
+        }
+        if (column.kind === 'date') {
+            return value === MISSING_DATE ? 'N/A' : new Date(value * 86400000).toISOString().slice(0, 10);
+        }
+        return isNaN(value) ? 'N/A' : value.toFixed(column.decimals) + column.suffix;
+    }
+
+    function tooltipHtml(ds, i) {
+        var lines = [];
+        ds.tooltip.forEach(function(field) {
+            var column = ds.columns[field[1]];
+            if (!column) { return; }
+            var text = escapeHtml(formatValue(column, i));
+            if (field[0]) { lines.push(field[0] + ': ' + text); } else if (text) { lines.push(text); }
+        });
+        if (!ds.offsets) {
+            lines.push('Lon: ' + ds.coords[2 * i + 1].toFixed(5));
+            lines.push('Lat: ' + ds.coords[2 * i].toFixed(5));
+        }
+        return lines.join('<br>');
+    }
+
+    var FastPointLayer = L.Layer.extend({
+        options: {pane: 'overlayPane', padding: 0.25, cellSize: 16, hitTolerance: 3},
+
+        initialize: function(datasets, options) {
+            L.setOptions(this, options);
+            this._datasets = datasets;
+            var total = datasets.reduce(function(sum, ds) { return sum + ds.count; }, 0);
+            // Web Mercator pixel coordinates at zoom 0; scaled by 2^zoom when drawing
+            this._x = new Float64Array(total);
+            this._y = new Float64Array(total);
+            // Per-point style index; each dataset currently owns one style slot
+            this._style = new Uint8Array(total);
+            this._local = new Uint32Array(total);
+            this._visible = new Uint8Array(total).fill(1);
+            this._starts = [];
+            this._styles = [];
+            var k = 0, self = this;
+            datasets.forEach(function(ds, d) {
+                self._starts.push(k);
+                self._styles.push({color: ds.color, radius: ds.radius});
+                ds.shown = ds.count;
+                for (var i = 0; i < ds.count; i++, k++) {
+                    var lat = ds.coords[2 * i], lon = ds.coords[2 * i + 1];
+                    var sin = Math.min(Math.max(Math.sin(lat * Math.PI / 180), -0.9999), 0.9999);
+                    self._x[k] = (lon + 180) / 360 * 256;
+                    self._y[k] = (0.5 - Math.log((1 + sin) / (1 - sin)) / (4 * Math.PI)) * 256;
+                    self._style[k] = d;
+                    self._local[k] = i;
+                }
+            });
+            this._byStyle = this._styles.map(function() { return []; });
+            for (var p = 0; p < total; p++) { this._byStyle[this._style[p]].push(p); }
+            this._byStyle = this._byStyle.map(function(list) { return Uint32Array.from(list); });
+            this._tooltip = L.tooltip({direction: 'top', offset: [0, -4]});
+        },
+
+        setDatasetVisibility: function(d, predicate) {
+            var ds = this._datasets[d], start = this._starts[d], shown = 0;
+            for (var i = 0; i < ds.count; i++) {
+                var visible = predicate(i) ? 1 : 0;
+                this._visible[start + i] = visible;
+                shown += visible;
+            }
+            ds.shown = shown;
+            return shown;
+        },
+
+        onAdd: function(map) {
+            this._canvas = L.DomUtil.create('canvas', 'leaflet-zoom-hide');
+            this._canvas.style.pointerEvents = 'none';
+            this.getPane().appendChild(this._canvas);
+            map.on('moveend zoomend resize viewreset', this.redraw, this);
+            map.on('mousemove', this._onMouseMove, this);
+            map.on('mouseout zoomstart', this._hideTooltip, this);
+            this.redraw();
+        },
+
+        onRemove: function(map) {
+            L.DomUtil.remove(this._canvas);
+            map.off('moveend zoomend resize viewreset', this.redraw, this);
+            map.off('mousemove', this._onMouseMove, this);
+            map.off('mouseout zoomstart', this._hideTooltip, this);
+            this._hideTooltip();
+            if (this._hovering) { map.getContainer().style.cursor = ''; }
+            this._hovering = false;
+            this._hit = null;
+        },
+
+        redraw: function() {
+            var map = this._map;
+            if (!map) { return this; }
+            var size = map.getSize(), pad = size.multiplyBy(this.options.padding).round();
+            var width = size.x + 2 * pad.x, height = size.y + 2 * pad.y;
+            var ratio = window.devicePixelRatio || 1;
+            var topLeft = map.containerPointToLayerPoint(pad.multiplyBy(-1)).round();
+            var canvas = this._canvas;
+            L.DomUtil.setPosition(canvas, topLeft);
+            canvas.width = width * ratio;
+            canvas.height = height * ratio;
+            canvas.style.width = width + 'px';
+            canvas.style.height = height + 'px';
+            var ctx = canvas.getContext('2d');
+            ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+
+            var scale = Math.pow(2, map.getZoom());
+            var origin = map.getPixelBounds().min.subtract(pad);
+            var cell = this.options.cellSize, grid = new Map();
+            for (var s = 0; s < this._styles.length; s++) {
+                var style = this._styles[s], r = style.radius, list = this._byStyle[s];
+                ctx.beginPath();
+                for (var j = 0; j < list.length; j++) {
+                    var k = list[j];
+                    if (!this._visible[k]) { continue; }
+                    var px = this._x[k] * scale - origin.x, py = this._y[k] * scale - origin.y;
+                    if (px < -r || py < -r || px > width + r || py > height + r) { continue; }
+                    ctx.moveTo(px + r, py);
+                    ctx.arc(px, py, r, 0, 2 * Math.PI);
+                    var key = Math.floor(px / cell) * 65536 + Math.floor(py / cell);
+                    var bucket = grid.get(key);
+                    if (bucket) { bucket.push(k); } else { grid.set(key, [k]); }
+                }
+                ctx.globalAlpha = 0.2;
+                ctx.fillStyle = style.color;
+                ctx.fill();
+                ctx.globalAlpha = 1;
+                ctx.lineWidth = 3;
+                ctx.strokeStyle = style.color;
+                ctx.stroke();
+            }
+            this._hit = {grid: grid, origin: origin, scale: scale, topLeft: topLeft};
+            return this;
+        },
+
+        _findNearest: function(layerPoint) {
+            var hit = this._hit, cell = this.options.cellSize;
+            var lx = layerPoint.x - hit.topLeft.x, ly = layerPoint.y - hit.topLeft.y;
+            var cx = Math.floor(lx / cell), cy = Math.floor(ly / cell);
+            var best = -1, bestDistance = Infinity;
+            for (var dx = -1; dx <= 1; dx++) {
+                for (var dy = -1; dy <= 1; dy++) {
+                    var bucket = hit.grid.get((cx + dx) * 65536 + (cy + dy));
+                    if (!bucket) { continue; }
+                    for (var b = 0; b < bucket.length; b++) {
+                        var k = bucket[b];
+                        var ex = this._x[k] * hit.scale - hit.origin.x - lx;
+                        var ey = this._y[k] * hit.scale - hit.origin.y - ly;
+                        var distance = ex * ex + ey * ey;
+                        var reach = this._styles[this._style[k]].radius + this.options.hitTolerance;
+                        if (distance <= reach * reach && distance < bestDistance) {
+                            best = k;
+                            bestDistance = distance;
+                        }
+                    }
+                }
+            }
+            return best;
+        },
+
+        _onMouseMove: function(e) {
+            if (!this._hit) { return; }
+            var k = this._findNearest(e.layerPoint);
+            // Several point layers share the map; each only resets the cursor it set itself
+            if (k >= 0 || this._hovering) { this._map.getContainer().style.cursor = k < 0 ? '' : 'pointer'; }
+            this._hovering = k >= 0;
+            if (k < 0) { this._hideTooltip(); return; }
+            var ds = this._datasets[this._style[k]], i = this._local[k];
+            this._tooltip
+                .setLatLng([ds.coords[2 * i], ds.coords[2 * i + 1]])
+                .setContent(tooltipHtml(ds, i));
+            // Only one point layer shows a tooltip at a time when points of several datasets overlap
+            var owner = this._map._fastPointTooltipOwner;
+            if (owner && owner !== this) { owner._hideTooltip(); }
+            this._map._fastPointTooltipOwner = this;
+            if (!this._map.hasLayer(this._tooltip)) { this._map.openTooltip(this._tooltip); }
+        },
+
+        _hideTooltip: function() {
+            if (this._map && this._map.hasLayer(this._tooltip)) { this._map.closeTooltip(this._tooltip); }
+        }
+    });
+
+    return {
+        decode: decode,
+        decodeDataset: decodeDataset,
+        tooltipHtml: tooltipHtml,
+        FastPointLayer: FastPointLayer
+    };
+})();
+""").render(missing_date=MISSING_DATE_DAYS)
+
+# --- Custom map element: shared browser-side helpers ---
+class MobilityViewerScript(MacroElement):
+    """
+    Emits MOBILITY_VIEWER_JS into the map script. Added once per map, ahead of the elements that use it.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        {{ this.viewer_js }}
+        {% endmacro %}
+    """)
+
+    def __init__(self):
+        super().__init__()
+        self._name = "MobilityViewerScript"
+        self.viewer_js = MOBILITY_VIEWER_JS
+
+def add_mobility_viewer_script(parent):
+    # A fixed child name keeps it to one copy however many layers are added
+    if "mobility_viewer_script" not in parent._children:
+        parent.add_child(MobilityViewerScript(), name="mobility_viewer_script")
+
+# --- Custom map element: canvas point renderer ---
+class FastPointLayer(folium.map.Layer):
+    """
+    Draws point datasets on a canvas from binary coordinate buffers instead of one SVG
+    CircleMarker per feature. Tooltips are resolved in the browser by hit-testing.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = new mobilityViewer.FastPointLayer(
+            {{ this.payload_json }}.map(mobilityViewer.decodeDataset)
+        );
+        {% endmacro %}
+    """)
+
+    def __init__(self, datasets, name=None, show=True):
+        super().__init__(name=name, overlay=True, control=True, show=show)
+        self._name = "FastPointLayer"
+        self.payload_json = encode_payload_json(datasets)
+
+    def add_to(self, parent, name=None, index=None):
+        add_mobility_viewer_script(parent)
+        return super().add_to(parent, name=name, index=index)
+
+# --- Custom map element: client-side filtering ---
+class ClientSideFilterLayer(MacroElement):
+    """
+    Decodes the compact dataset payload in the browser and applies filter toggles in JavaScript.
+    Selection rules match the server-side filters: values within one filter are OR-ed, collision
+    characteristics must all be present, and different filters on the same dataset are AND-ed.
+    Point datasets share one FastPointLayer canvas; street centrelines are drawn as polylines.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var datasets = {{ this.payload_json }}.map(mobilityViewer.decodeDataset);
+            var renderer = L.canvas({padding: 0.5});
+            var pointDatasets = datasets.filter(function(ds) { return !ds.offsets; });
+            var pointLayer = new mobilityViewer.FastPointLayer(pointDatasets);
+
+            datasets.forEach(function(ds) {
+                ds.filters.forEach(function(f) {
+                    f.kind = ds.columns[f.column].kind;
+                    f.selected = new Uint8Array(ds.columns[f.column].labels.length);
+                    f.active = 0;
+                    f.mask = 0;
+                });
+                ds.shown = 0;
+                if (ds.offsets) {
+                    ds.layer = L.layerGroup().addTo(map);
+                } else {
+                    pointLayer.setDatasetVisibility(pointDatasets.indexOf(ds), function() { return false; });
+                }
+            });
+            pointLayer.addTo(map);
+
+            function matches(ds, i) {
+                for (var k = 0; k < ds.filters.length; k++) {
+                    var f = ds.filters[k];
+                    if (!f.active) { continue; }
+                    var value = ds.columns[f.column].values[i];
+                    if (f.kind === 'bits') {
+                        if ((value & f.mask) !== f.mask) { return false; }
+                    } else if (!f.selected[value]) {
+                        return false;
+                    }
+                }
+                return true;
+            }
+
+            function renderLines(ds, active) {
+                ds.layer.clearLayers();
+                ds.shown = 0;
+                if (!active) { return; }
+                var tooltipFor = function(i) { return function() { return mobilityViewer.tooltipHtml(ds, i); }; };
+                for (var i = 0; i < ds.count; i++) {
+                    if (!matches(ds, i)) { continue; }
+                    var latlngs = [];
+                    for (var v = ds.offsets[i]; v < ds.offsets[i + 1]; v++) {
+                        latlngs.push([ds.coords[2 * v], ds.coords[2 * v + 1]]);
+                    }
+                    L.polyline(latlngs, {renderer: renderer, color: ds.color, weight: ds.radius, opacity: 0.8})
+                        .bindTooltip(tooltipFor(i))
+                        .addTo(ds.layer);
+                    ds.shown++;
+                }
+            }
+
+            function renderDataset(ds) {
+                var active = ds.filters.some(function(f) { return f.active; });
+                if (ds.offsets) {
+                    renderLines(ds, active);
+                    return;
+                }
+                pointLayer.setDatasetVisibility(pointDatasets.indexOf(ds), function(i) { return active && matches(ds, i); });
+                pointLayer.redraw();
+            }
+
+            var panel = L.control({position: 'topright'});
+            var totalLabel;
+
+            function updateTotal() {
+                var total = datasets.reduce(function(sum, ds) { return sum + ds.shown; }, 0);
+                totalLabel.textContent = 'Total data points rendered: ' + total;
+            }
+
+            panel.onAdd = function() {
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.cssText = 'background:white; padding:6px; max-height:420px; overflow-y:auto; font-size:12px; min-width:220px;';
+                L.DomEvent.disableClickPropagation(div);
+                L.DomEvent.disableScrollPropagation(div);
+                totalLabel = L.DomUtil.create('div', '', div);
+                totalLabel.style.fontWeight = 'bold';
+                datasets.forEach(function(ds) {
+                    ds.filters.forEach(function(f) {
+                        var column = ds.columns[f.column];
+                        var details = L.DomUtil.create('details', '', div);
+                        var summary = L.DomUtil.create('summary', '', details);
+                        summary.textContent = f.label;
+                        summary.style.cssText = 'background:' + f.color + '; color:white; padding:3px 6px; margin-top:4px; border-radius:4px; font-weight:bold; cursor:pointer;';
+                        column.labels.forEach(function(label, code) {
+                            if (!column.counts[code]) { return; }
+                            var row = L.DomUtil.create('label', '', details);
+                            row.style.display = 'block';
+                            var box = L.DomUtil.create('input', '', row);
+                            box.type = 'checkbox';
+                            row.appendChild(document.createTextNode(' ' + label + ' (' + column.counts[code] + ')'));
+                            L.DomEvent.on(box, 'change', function() {
+                                f.selected[code] = box.checked ? 1 : 0;
+                                f.active += box.checked ? 1 : -1;
+                                if (f.kind === 'bits') { f.mask = box.checked ? (f.mask | (1 << code)) : (f.mask & ~(1 << code)); }
+                                renderDataset(ds);
+                                updateTotal();
+                            });
+                        });
+                    });
+                });
+                updateTotal();
+                return div;
+            };
+            panel.addTo(map);
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, payload_json):
+        super().__init__()
+        self._name = "ClientSideFilterLayer"
+        self.payload_json = payload_json
+
+    def add_to(self, parent, name=None, index=None):
+        add_mobility_viewer_script(parent)
+        return super().add_to(parent, name=name, index=index)
+
+# --- Street/location search ---
+@st.cache_resource(show_spinner="Building street search index...")
+def get_street_search_index():
+    return StreetSearchIndex([
+        ("Street Centrelines", centrelines_gdf, ['full_name', 'from_str', 'to_str']),
+        ("Traffic Controls", traffic_controls_gdf, ['LOCATION']),
+        ("Traffic Calming", traffic_calming_gdf, ['LOCATION']),
+        ("Collisions", load_all_traffic_collisions(), ['ROAD_LOCAT']),
+    ])
+
+@st.cache_data(max_entries=32)
+def get_street_area(street_name):
+    return get_street_search_index().area(street_name)
+
+def restrict_to_area(gdf, area):
+    """
+    Keeps only the features of a filtered layer that intersect `area` (None keeps everything).
+    """
+    if area is None or gdf.empty:
+        return gdf
+    return gdf.iloc[np.sort(gdf.sindex.query(area, predicate='intersects'))]
+
+# --- Area selection statistics ---
+@st.cache_resource(show_spinner="Indexing datasets for area statistics...")
+def get_area_statistics_index():
+    return AreaStatisticsIndex([
+        ("Junctions", junctions_gdf, [("Junction type", 'JUNCTION_T', lambda x: JUNCTION_TYPE_LABELS.get(x, f"Unknown Type {x}"))]),
+        ("Traffic Controls", traffic_controls_gdf, [("Control type", 'CONTROL_TY', lambda x: TRAFFIC_CONTROL_TYPE_LABELS.get(x, f"Unknown Type {x}"))]),
+        ("Traffic Calming", traffic_calming_gdf, [("Asset code", 'ASSETCODE', lambda x: TRAFFIC_CALMING_ASSETCODE_LABELS.get(x, x))]),
+        ("Street Lights", street_lights_gdf, [("Use", 'LIGHTUSE', lambda x: LIGHTUSE_LABELS.get(x, x)), ("Material", 'MAT', str)]),
+        ("Collisions", load_all_traffic_collisions(), [("Year", 'Year', str), ("Characteristic", None, None)]),
+    ], centrelines_gdf)
 
-    return data_to_filter
+@st.cache_data(max_entries=64)
+def get_area_statistics(selection_wkt):
+    return get_area_statistics_index().query(shapely.from_wkt(selection_wkt))
+
+# --- Collision timeline: date-sorted index and playback frames ---
+# Playback step and how long a frame's points stay visible; durations are a day short of the step
+# because the time control keeps points up to and including the start of the shown window
+PLAYBACK_PERIODS = {"Weekly": ('P7D', 'P6D'), "Monthly": ('P1M', 'P27D')}
+
+@st.cache_resource(show_spinner="Indexing collision dates...")
+def get_collision_timeline():
+    return CollisionTimeline(load_all_traffic_collisions())
+
+@st.cache_data(max_entries=16)
+def get_collision_playback_geojson(start_date, end_date, selected_years_tuple, active_characteristics_tuple, playback, street_name=None):
+    """
+    Groups the selected collisions into weekly or monthly frames, one timestamped MultiPoint per frame,
+    so the browser steps through every frame without a rerun. `street_name` restricts the frames to
+    the surroundings of that street, as the static layer does.
+    """
+    timeline = get_collision_timeline()
+    area = get_street_area(street_name) if street_name else None
+    positions = timeline.positions(start_date, end_date, selected_years_tuple, active_characteristics_tuple, area)
+    frame_starts = playback_frame_starts(timeline.days[positions], playback)
+    geometries = timeline.gdf.geometry.values[positions]
+    lons = np.round(shapely.get_x(geometries), 5)
+    lats = np.round(shapely.get_y(geometries), 5)
+    features = []
+    frame_values, frame_first = np.unique(frame_starts, return_index=True)
+    frame_bounds = list(frame_first) + [len(frame_starts)]
+    for i, frame_start in enumerate(frame_values):
+        lo, hi = frame_bounds[i], frame_bounds[i + 1]
+        frame_time = str(frame_start)
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'MultiPoint', 'coordinates': np.column_stack([lons[lo:hi], lats[lo:hi]]).tolist()},
+            'properties': {
+                'times': [frame_time] * (hi - lo),
+                'icon': 'circle',
+                'iconstyle': {'radius': 3, 'color': 'orange', 'fillColor': 'orange', 'fillOpacity': 0.8, 'weight': 1},
+                'tooltip': f"{hi - lo} collisions from {frame_time}",
+            },
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+# --- Collision OLAP cube ---
+@st.cache_resource(show_spinner="Building collision cube...")
+def get_collision_cube():
+    return CollisionCube()
 
 # --- UI: Title and layout columns ---
 st.title("Halifax Urban Mobility Data Viewer")
@@ -431,137 +957,210 @@ left_col, right_col = st.columns([1, 2])
 
 # --- UI: Controls for all filters (left column) ---
 with left_col:
-    with st.form(key="filter_form"):
-        # --- UI: Filter dropdowns using the helper function ---
-        
-        # Junctions
-        junction_type_counts = junctions_gdf['JUNCTION_T'].value_counts().to_dict()
-        all_junction_types = sorted([key for key in JUNCTION_TYPE_LABELS.keys() if junction_type_counts.get(key, 0) > 0])
-        def format_junction_label_with_count(x):
-            count = junction_type_counts.get(x, 0)
-            return f"{x}: {JUNCTION_TYPE_LABELS[x]} ({count})"
-        generate_filter_control(
-            "Junctions", "#1976d2", all_junction_types, format_junction_label_with_count,
-            AppSessionStateKeys.SELECTED_JUNCTION_TYPES, "junction_type_multiselect"
-        )
+    st.toggle(
+        "Client-side filtering",
+        key=AppSessionStateKeys.CLIENT_SIDE_FILTERING,
+        help="Ship every dataset to the browser once and filter from the panel on the map, without a rerun per change."
+    )
+    client_side_filtering = st.session_state[AppSessionStateKeys.CLIENT_SIDE_FILTERING]
 
-        # Traffic Controls
-        if 'CONTROL_TY' in traffic_controls_gdf.columns:
-            control_type_counts = traffic_controls_gdf['CONTROL_TY'].value_counts().to_dict()
-            all_control_types = sorted([key for key in TRAFFIC_CONTROL_TYPE_LABELS.keys() if control_type_counts.get(key, 0) > 0])
-            def format_control_label_with_count(x):
-                count = control_type_counts.get(x, 0)
-                label = TRAFFIC_CONTROL_TYPE_LABELS.get(x, f"Unknown Type {x}")
-                return f"{label} ({count})"
-            generate_filter_control(
-                "Traffic Controls", "#d32f2f", all_control_types, format_control_label_with_count,
-                AppSessionStateKeys.SELECTED_TRAFFIC_CONTROL_TYPES, "traffic_control_type_multiselect"
+    # --- UI: Street/location search ---
+    search_query = st.text_input(
+        "Find a street or location", key=AppSessionStateKeys.STREET_SEARCH_QUERY, placeholder="e.g. BARRINGTON ST"
+    )
+    if search_query:
+        search_index = get_street_search_index()
+        search_start = time.time()
+        search_results = search_index.search(search_query)
+        search_time = time.time() - search_start
+        if search_results:
+            def format_search_result(i):
+                result = search_results[i]
+                return f"{result['name']} ({sum(result['counts'].values())} features)"
+            chosen_result = st.selectbox(
+                f"{len(search_results)} matches in {search_time * 1000:.1f} ms",
+                range(len(search_results)), format_func=format_search_result, key="street_search_result_select"
             )
+            if st.button("Zoom to street"):
+                result_bounds = search_results[chosen_result]['bounds']
+                st.session_state[AppSessionStateKeys.MAP_CENTER] = [(result_bounds[1] + result_bounds[3]) / 2, (result_bounds[0] + result_bounds[2]) / 2]
+                st.session_state[AppSessionStateKeys.MAP_ZOOM] = zoom_for_bounds(result_bounds)
+                st.session_state[AppSessionStateKeys.ACTIVE_STREET] = search_results[chosen_result]['name']
+                st.rerun()
         else:
-            st.warning("Column 'CONTROL_TY' not found in traffic controls data. Cannot display multiselect.")
-
-        # Collisions (year)
-        available_collision_years = get_available_collision_years()
-        collision_year_counts = get_all_collision_year_counts() if available_collision_years else {}
-        def format_year_label_with_count(year_val):
-            count = collision_year_counts.get(year_val, 0)
-            return f"{year_val} ({count})"
-        if available_collision_years:
-            generate_filter_control(
-                "Collisions (year)", "#ff9800", available_collision_years, format_year_label_with_count,
-                AppSessionStateKeys.SELECTED_COLLISION_YEARS, "traffic_collision_year_multiselect"
-            )
-        else:
-            st.warning("No collision data files found in 'traffic_collisions_by_year/'. Year selection is unavailable.")
-            st.session_state[AppSessionStateKeys.SELECTED_COLLISION_YEARS] = []
-            
-        # Collisions (type)
-        # Counts for these are now pre-calculated and stored in session state
-        total_characteristic_counts = st.session_state.get(AppSessionStateKeys.TOTAL_CHARACTERISTIC_COUNTS, {})
-        def format_characteristic_label_with_count(key):
-            label = key.replace('_', ' ').title()
-            count = total_characteristic_counts.get(key, 0) # Use pre-calculated total counts
-            return f"{label} ({count})"
-        generate_filter_control(
-            "Collisions (type)", "#ff9800", list(COLLISION_CHARACTERISTIC_FILTERS.keys()), 
-            format_characteristic_label_with_count,
-            AppSessionStateKeys.SELECTED_COLLISION_CHARACTERISTICS, 
-            "collision_characteristic_multiselect",
-            default_selected_values=st.session_state.get(AppSessionStateKeys.SELECTED_COLLISION_CHARACTERISTICS, [])
+            st.caption("No matching streets or locations.")
+
+    active_street = st.session_state.get(AppSessionStateKeys.ACTIVE_STREET)
+    if active_street:
+        st.session_state[AppSessionStateKeys.RESTRICT_TO_STREET] = st.checkbox(
+            f"Only show features on or near {active_street}",
+            value=st.session_state.get(AppSessionStateKeys.RESTRICT_TO_STREET, False),
+            key="restrict_to_street_checkbox",
+            disabled=client_side_filtering,
+            help=f"Keeps features within {STREET_PROXIMITY_METERS} m of the street. Applies to server-rendered layers."
         )
 
-        # Traffic Calming
-        if not traffic_calming_gdf.empty and 'ASSETCODE' in traffic_calming_gdf.columns:
-            asset_code_counts = traffic_calming_gdf['ASSETCODE'].value_counts().to_dict()
-            all_asset_codes = sorted([key for key in TRAFFIC_CALMING_ASSETCODE_LABELS.keys() if asset_code_counts.get(key, 0) > 0])
-            def format_asset_code_label_with_count(x):
-                count = asset_code_counts.get(x, 0)
-                label = TRAFFIC_CALMING_ASSETCODE_LABELS.get(x, f"Unknown Asset Code {x}")
-                return f"{label} ({count})"
+    if client_side_filtering:
+        st.info("Filters are applied in the browser. Use the panel in the top-right corner of the map.")
+        submitted = False
+    else:
+        with st.form(key="filter_form"):
+            # --- UI: Filter dropdowns using the helper function ---
+        
+            # Junctions
+            junction_type_counts = junctions_gdf['JUNCTION_T'].value_counts().to_dict()
+            all_junction_types = sorted([key for key in JUNCTION_TYPE_LABELS.keys() if junction_type_counts.get(key, 0) > 0])
+            def format_junction_label_with_count(x):
+                count = junction_type_counts.get(x, 0)
+                return f"{x}: {JUNCTION_TYPE_LABELS[x]} ({count})"
             generate_filter_control(
-                "Traffic Calming", "#008080", all_asset_codes, format_asset_code_label_with_count,
-                AppSessionStateKeys.SELECTED_TRAFFIC_CALMING_ASSET_CODES, "traffic_calming_asset_code_multiselect"
+                "Junctions", "#1976d2", all_junction_types, format_junction_label_with_count,
+                AppSessionStateKeys.SELECTED_JUNCTION_TYPES, "junction_type_multiselect"
             )
-        else:
-            st.warning("Traffic calming data is not available or 'ASSETCODE' column is missing.")
-
-        # Street Lights (Use)
-        if not street_lights_gdf.empty and 'LIGHTUSE' in street_lights_gdf.columns:
-            lightuse_counts = street_lights_gdf['LIGHTUSE'].value_counts().to_dict()
-            all_lightuse_values = sorted(street_lights_gdf['LIGHTUSE'].unique())
-            def format_lightuse_label_with_count(x):
-                count = lightuse_counts.get(x, 0)
-                label = LIGHTUSE_LABELS.get(x, x)
+
+            # Traffic Controls
+            if 'CONTROL_TY' in traffic_controls_gdf.columns:
+                control_type_counts = traffic_controls_gdf['CONTROL_TY'].value_counts().to_dict()
+                all_control_types = sorted([key for key in TRAFFIC_CONTROL_TYPE_LABELS.keys() if control_type_counts.get(key, 0) > 0])
+                def format_control_label_with_count(x):
+                    count = control_type_counts.get(x, 0)
+                    label = TRAFFIC_CONTROL_TYPE_LABELS.get(x, f"Unknown Type {x}")
+                    return f"{label} ({count})"
+                generate_filter_control(
+                    "Traffic Controls", "#d32f2f", all_control_types, format_control_label_with_count,
+                    AppSessionStateKeys.SELECTED_TRAFFIC_CONTROL_TYPES, "traffic_control_type_multiselect"
+                )
+            else:
+                st.warning("Column 'CONTROL_TY' not found in traffic controls data. Cannot display multiselect.")
+
+            # Collisions (year)
+            available_collision_years = get_available_collision_years()
+            collision_year_counts = get_all_collision_year_counts() if available_collision_years else {}
+            def format_year_label_with_count(year_val):
+                count = collision_year_counts.get(year_val, 0)
+                return f"{year_val} ({count})"
+            if available_collision_years:
+                generate_filter_control(
+                    "Collisions (year)", "#ff9800", available_collision_years, format_year_label_with_count,
+                    AppSessionStateKeys.SELECTED_COLLISION_YEARS, "traffic_collision_year_multiselect"
+                )
+            else:
+                st.warning("No collision data files found in 'traffic_collisions_by_year/'. Year selection is unavailable.")
+                st.session_state[AppSessionStateKeys.SELECTED_COLLISION_YEARS] = []
+            
+            # Collisions (type)
+            # Counts for these are now pre-calculated and stored in session state
+            total_characteristic_counts = st.session_state.get(AppSessionStateKeys.TOTAL_CHARACTERISTIC_COUNTS, {})
+            def format_characteristic_label_with_count(key):
+                label = key.replace('_', ' ').title()
+                count = total_characteristic_counts.get(key, 0) # Use pre-calculated total counts
                 return f"{label} ({count})"
             generate_filter_control(
-                "Street Lights (Use)", "#DAA520", all_lightuse_values, format_lightuse_label_with_count,
-                AppSessionStateKeys.SELECTED_STREET_LIGHT_USES, "street_light_use_multiselect",
-                default_selected_values=st.session_state.get(AppSessionStateKeys.SELECTED_STREET_LIGHT_USES, [])
+                "Collisions (type)", "#ff9800", list(COLLISION_CHARACTERISTIC_FILTERS.keys()), 
+                format_characteristic_label_with_count,
+                AppSessionStateKeys.SELECTED_COLLISION_CHARACTERISTICS, 
+                "collision_characteristic_multiselect",
+                default_selected_values=st.session_state.get(AppSessionStateKeys.SELECTED_COLLISION_CHARACTERISTICS, [])
             )
-        else:
-            st.warning("Street lights data is not available or 'LIGHTUSE' column is missing.")
-
-        # Street Lights (Material)
-        if not street_lights_gdf.empty and 'MAT' in street_lights_gdf.columns:
-            material_counts = street_lights_gdf['MAT'].value_counts().to_dict()
-            all_material_values = sorted(street_lights_gdf['MAT'].unique())
-            def format_material_label_with_count(x):
-                count = material_counts.get(x, 0)
-                return f"{x} ({count})"
-            generate_filter_control(
-                "Street Lights (Material)", "#DAA520", all_material_values, format_material_label_with_count,
-                AppSessionStateKeys.SELECTED_STREET_LIGHT_MATERIALS, "street_light_material_multiselect",
-                default_selected_values=st.session_state.get(AppSessionStateKeys.SELECTED_STREET_LIGHT_MATERIALS, [])
-            )
-        else:
-            st.warning("Street lights data is not available or 'MAT' column is missing.")
-            
-        # Street Centrelines (segment length)
-        centreline_bucket_counts = centrelines_gdf['length_bucket'].value_counts().to_dict()
-        all_centreline_buckets = [b for b in centrelines_gdf['length_bucket'].cat.categories if centreline_bucket_counts.get(b, 0) > 0]
-        def format_centreline_bucket_label_with_count(x):
-            count = centreline_bucket_counts.get(x, 0)
-            return f"{x} ({count})"
-        generate_filter_control(
-            "Street Segments (Length)", "#1565c0", all_centreline_buckets, format_centreline_bucket_label_with_count,
-            AppSessionStateKeys.SELECTED_CENTRELINE_BUCKETS, "centreline_bucket_multiselect"
-        )
 
-        # Street Centrelines (street segmentclassification)
-        if 'st_class' in centrelines_gdf.columns:
-            st_class_counts = centrelines_gdf['st_class'].value_counts(dropna=True).to_dict()
-            all_st_classes = sorted(st_class_counts.keys())
-            def format_st_class_label_with_count(x):
-                count = st_class_counts.get(x, 0)
+            # Collisions (date range and playback)
+            collision_timeline = get_collision_timeline()
+            if collision_timeline.first_date is not None:
+                use_collision_date_range = st.checkbox(
+                    "Filter collisions by date range",
+                    value=st.session_state.get(AppSessionStateKeys.SELECTED_COLLISION_DATE_RANGE) is not None,
+                    key="collision_date_range_checkbox"
+                )
+                collision_date_range = st.slider(
+                    "Collision dates",
+                    min_value=collision_timeline.first_date,
+                    max_value=collision_timeline.last_date,
+                    value=st.session_state.get(AppSessionStateKeys.SELECTED_COLLISION_DATE_RANGE) or (collision_timeline.first_date, collision_timeline.last_date),
+                    format="YYYY-MM-DD",
+                    key="collision_date_range_slider"
+                )
+                st.session_state[AppSessionStateKeys.SELECTED_COLLISION_DATE_RANGE] = tuple(collision_date_range) if use_collision_date_range else None
+                playback_options = ["Off", *PLAYBACK_PERIODS.keys()]
+                st.session_state[AppSessionStateKeys.SELECTED_COLLISION_PLAYBACK] = st.selectbox(
+                    "Collision playback",
+                    playback_options,
+                    index=playback_options.index(st.session_state.get(AppSessionStateKeys.SELECTED_COLLISION_PLAYBACK, "Off")),
+                    key="collision_playback_select",
+                    help="Animates the selected collisions by week or month. All frames are sent to the map once and played in the browser."
+                )
+
+            # Traffic Calming
+            if not traffic_calming_gdf.empty and 'ASSETCODE' in traffic_calming_gdf.columns:
+                asset_code_counts = traffic_calming_gdf['ASSETCODE'].value_counts().to_dict()
+                all_asset_codes = sorted([key for key in TRAFFIC_CALMING_ASSETCODE_LABELS.keys() if asset_code_counts.get(key, 0) > 0])
+                def format_asset_code_label_with_count(x):
+                    count = asset_code_counts.get(x, 0)
+                    label = TRAFFIC_CALMING_ASSETCODE_LABELS.get(x, f"Unknown Asset Code {x}")
+                    return f"{label} ({count})"
+                generate_filter_control(
+                    "Traffic Calming", "#008080", all_asset_codes, format_asset_code_label_with_count,
+                    AppSessionStateKeys.SELECTED_TRAFFIC_CALMING_ASSET_CODES, "traffic_calming_asset_code_multiselect"
+                )
+            else:
+                st.warning("Traffic calming data is not available or 'ASSETCODE' column is missing.")
+
+            # Street Lights (Use)
+            if not street_lights_gdf.empty and 'LIGHTUSE' in street_lights_gdf.columns:
+                lightuse_counts = street_lights_gdf['LIGHTUSE'].value_counts().to_dict()
+                all_lightuse_values = sorted(street_lights_gdf['LIGHTUSE'].unique())
+                def format_lightuse_label_with_count(x):
+                    count = lightuse_counts.get(x, 0)
+                    label = LIGHTUSE_LABELS.get(x, x)
+                    return f"{label} ({count})"
+                generate_filter_control(
+                    "Street Lights (Use)", "#DAA520", all_lightuse_values, format_lightuse_label_with_count,
+                    AppSessionStateKeys.SELECTED_STREET_LIGHT_USES, "street_light_use_multiselect",
+                    default_selected_values=st.session_state.get(AppSessionStateKeys.SELECTED_STREET_LIGHT_USES, [])
+                )
+            else:
+                st.warning("Street lights data is not available or 'LIGHTUSE' column is missing.")
+
+            # Street Lights (Material)
+            if not street_lights_gdf.empty and 'MAT' in street_lights_gdf.columns:
+                material_counts = street_lights_gdf['MAT'].value_counts().to_dict()
+                all_material_values = sorted(street_lights_gdf['MAT'].unique())
+                def format_material_label_with_count(x):
+                    count = material_counts.get(x, 0)
+                    return f"{x} ({count})"
+                generate_filter_control(
+                    "Street Lights (Material)", "#DAA520", all_material_values, format_material_label_with_count,
+                    AppSessionStateKeys.SELECTED_STREET_LIGHT_MATERIALS, "street_light_material_multiselect",
+                    default_selected_values=st.session_state.get(AppSessionStateKeys.SELECTED_STREET_LIGHT_MATERIALS, [])
+                )
+            else:
+                st.warning("Street lights data is not available or 'MAT' column is missing.")
+            
+            # Street Centrelines (segment length)
+            centreline_bucket_counts = centrelines_gdf['length_bucket'].value_counts().to_dict()
+            all_centreline_buckets = [b for b in centrelines_gdf['length_bucket'].cat.categories if centreline_bucket_counts.get(b, 0) > 0]
+            def format_centreline_bucket_label_with_count(x):
+                count = centreline_bucket_counts.get(x, 0)
                 return f"{x} ({count})"
             generate_filter_control(
-                "Street Segments (Classification)", "#1565c0", all_st_classes, format_st_class_label_with_count,
-                AppSessionStateKeys.SELECTED_CENTRELINE_ST_CLASS, "centreline_stclass_multiselect"
+                "Street Segments (Length)", "#1565c0", all_centreline_buckets, format_centreline_bucket_label_with_count,
+                AppSessionStateKeys.SELECTED_CENTRELINE_BUCKETS, "centreline_bucket_multiselect"
             )
-        else:
-            st.warning("Column 'st_class' not found in street centrelines data. Class filter is unavailable.")
 
-        submitted = st.form_submit_button("Render")
+            # Street Centrelines (street segmentclassification)
+            if 'st_class' in centrelines_gdf.columns:
+                st_class_counts = centrelines_gdf['st_class'].value_counts(dropna=True).to_dict()
+                all_st_classes = sorted(st_class_counts.keys())
+                def format_st_class_label_with_count(x):
+                    count = st_class_counts.get(x, 0)
+                    return f"{x} ({count})"
+                generate_filter_control(
+                    "Street Segments (Classification)", "#1565c0", all_st_classes, format_st_class_label_with_count,
+                    AppSessionStateKeys.SELECTED_CENTRELINE_ST_CLASS, "centreline_stclass_multiselect"
+                )
+            else:
+                st.warning("Column 'st_class' not found in street centrelines data. Class filter is unavailable.")
+
+            submitted = st.form_submit_button("Render")
 
     # --- Unified Render and Clear Map buttons ---
     if submitted:
@@ -570,6 +1169,8 @@ with left_col:
         st.session_state[AppSessionStateKeys.LAST_RENDERED_TRAFFIC_CONTROL_TYPES] = list(st.session_state[AppSessionStateKeys.SELECTED_TRAFFIC_CONTROL_TYPES])
         st.session_state[AppSessionStateKeys.LAST_RENDERED_COLLISION_YEARS] = list(st.session_state[AppSessionStateKeys.SELECTED_COLLISION_YEARS])
         st.session_state[AppSessionStateKeys.LAST_RENDERED_COLLISION_CHARACTERISTICS] = list(st.session_state[AppSessionStateKeys.SELECTED_COLLISION_CHARACTERISTICS])
+        st.session_state[AppSessionStateKeys.LAST_RENDERED_COLLISION_DATE_RANGE] = st.session_state[AppSessionStateKeys.SELECTED_COLLISION_DATE_RANGE]
+        st.session_state[AppSessionStateKeys.LAST_RENDERED_COLLISION_PLAYBACK] = st.session_state[AppSessionStateKeys.SELECTED_COLLISION_PLAYBACK]
         st.session_state[AppSessionStateKeys.LAST_RENDERED_TRAFFIC_CALMING_ASSET_CODES] = list(st.session_state[AppSessionStateKeys.SELECTED_TRAFFIC_CALMING_ASSET_CODES])
         st.session_state[AppSessionStateKeys.LAST_RENDERED_STREET_LIGHT_USES] = list(st.session_state[AppSessionStateKeys.SELECTED_STREET_LIGHT_USES])
         st.session_state[AppSessionStateKeys.LAST_RENDERED_STREET_LIGHT_MATERIALS] = list(st.session_state[AppSessionStateKeys.SELECTED_STREET_LIGHT_MATERIALS])
@@ -588,6 +1189,8 @@ with left_col:
         st.session_state[AppSessionStateKeys.LAST_RENDERED_TRAFFIC_CONTROL_TYPES] = []
         st.session_state[AppSessionStateKeys.LAST_RENDERED_COLLISION_YEARS] = []
         st.session_state[AppSessionStateKeys.LAST_RENDERED_COLLISION_CHARACTERISTICS] = []
+        st.session_state[AppSessionStateKeys.LAST_RENDERED_COLLISION_DATE_RANGE] = None
+        st.session_state[AppSessionStateKeys.LAST_RENDERED_COLLISION_PLAYBACK] = "Off"
         st.session_state[AppSessionStateKeys.LAST_RENDERED_TRAFFIC_CALMING_ASSET_CODES] = []
         st.session_state[AppSessionStateKeys.LAST_RENDERED_STREET_LIGHT_USES] = []
         st.session_state[AppSessionStateKeys.LAST_RENDERED_STREET_LIGHT_MATERIALS] = []
@@ -597,13 +1200,18 @@ with left_col:
         st.session_state[AppSessionStateKeys.SELECTED_TRAFFIC_CONTROL_TYPES] = []
         st.session_state[AppSessionStateKeys.SELECTED_COLLISION_YEARS] = []
         st.session_state[AppSessionStateKeys.SELECTED_COLLISION_CHARACTERISTICS] = []
+        st.session_state[AppSessionStateKeys.SELECTED_COLLISION_DATE_RANGE] = None
+        st.session_state[AppSessionStateKeys.SELECTED_COLLISION_PLAYBACK] = "Off"
         st.session_state[AppSessionStateKeys.SELECTED_TRAFFIC_CALMING_ASSET_CODES] = []
         st.session_state[AppSessionStateKeys.SELECTED_STREET_LIGHT_USES] = []
         st.session_state[AppSessionStateKeys.SELECTED_STREET_LIGHT_MATERIALS] = []
         st.session_state[AppSessionStateKeys.SELECTED_CENTRELINE_BUCKETS] = []
         st.session_state[AppSessionStateKeys.SELECTED_CENTRELINE_ST_CLASS] = []
         st.session_state[AppSessionStateKeys.CENTRELINE_BUCKET_COUNTS] = {label: 0 for label in centrelines_gdf['length_bucket'].cat.categories}
+        st.session_state[AppSessionStateKeys.AREA_SELECTION] = None
         st.session_state[AppSessionStateKeys.ACTIVE_BASEMAP] = "OpenStreetMap"
+        st.session_state[AppSessionStateKeys.ACTIVE_STREET] = None
+        st.session_state[AppSessionStateKeys.RESTRICT_TO_STREET] = False
         st.rerun()
 
 # --- UI: Map rendering and statistics (right column) ---
@@ -628,7 +1236,17 @@ with right_col:
         active_basemap_name = "OpenStreetMap"
 
     # Initialize map with no default tiles
-    m = folium.Map(location=map_center, zoom_start=map_zoom, tiles=None, max_bounds=False)
+    # In client-side mode the map HTML must stay identical between reruns so the payload is not
+    # re-sent; view changes (e.g. zoom to a street) go through st_folium's center/zoom instead
+    if client_side_filtering:
+        m = folium.Map(location=DEFAULT_MAP_CENTER, zoom_start=DEFAULT_MAP_ZOOM, tiles=None, max_bounds=False)
+    else:
+        m = folium.Map(location=map_center, zoom_start=map_zoom, tiles=None, max_bounds=False)
+
+    # In client-side mode the basemap choice is left out of the HTML: switching basemaps in the
+    # layer control must not change the map, or st_folium would rebuild it and re-send the payload
+    if client_side_filtering:
+        active_basemap_name = "OpenStreetMap"
 
     # Add the active basemap first to set it as the default layer
     folium.TileLayer(
@@ -656,91 +1274,74 @@ with right_col:
     filter_start = time.time()
     junctions_count = controls_count = collisions_count = traffic_calming_count = street_lights_count = centrelines_count = 0
     
-    show_features = st.session_state.get(AppSessionStateKeys.SHOW_ALL_SELECTED_FEATURES, False)
+    # In client-side mode the browser does all filtering, so no server-side layers are built
+    show_features = st.session_state.get(AppSessionStateKeys.SHOW_ALL_SELECTED_FEATURES, False) and not client_side_filtering
+    if client_side_filtering:
+        ClientSideFilterLayer(get_client_side_payload_json()).add_to(m)
+
+    # Point datasets are collected here and each drawn by its own FastPointLayer
+    point_layer_payloads = []
+
+    # Optional restriction of every layer to the surroundings of the searched street
+    restrict_street = None
+    street_area = None
+    if show_features and active_street and st.session_state.get(AppSessionStateKeys.RESTRICT_TO_STREET):
+        restrict_street = active_street
+        street_area = get_street_area(active_street)
 
     # Junctions
     if show_features and st.session_state.get(AppSessionStateKeys.LAST_RENDERED_JUNCTION_TYPES):
         selected_types_tuple = tuple(sorted(st.session_state.get(AppSessionStateKeys.LAST_RENDERED_JUNCTION_TYPES, [])))
         filtered_junctions = get_filtered_junction_data(selected_types_tuple)
-        def junction_tooltip_generator(row):
-            label_key = row.get('JUNCTION_T')
-            label = JUNCTION_TYPE_LABELS.get(label_key, f"Unknown Type {label_key}")
-            return f"Junction Type: {label}<br>Lon: {row.geometry.x:.5f}<br>Lat: {row.geometry.y:.5f}"
-        junctions_count = add_generic_point_layer(
-            m, filtered_junctions, "JunctionsLayer", 'blue', 5, 
-            junction_tooltip_generator, selected_types_tuple
-        )
+        filtered_junctions = restrict_to_area(filtered_junctions, street_area)
+        junctions_count = add_point_layer_payload(point_layer_payloads, filtered_junctions, build_junctions_payload)
 
     # Traffic Controls
     if show_features and st.session_state.get(AppSessionStateKeys.LAST_RENDERED_TRAFFIC_CONTROL_TYPES):
         selected_types_tuple = tuple(sorted(st.session_state.get(AppSessionStateKeys.LAST_RENDERED_TRAFFIC_CONTROL_TYPES, [])))
         filtered_controls = get_filtered_traffic_controls_data(selected_types_tuple)
-        def control_tooltip_generator(row):
-            control_type_key = row.get('CONTROL_TY')
-            label = TRAFFIC_CONTROL_TYPE_LABELS.get(control_type_key, f"Unknown Type {control_type_key}")
-            return f"Control Type: {label}<br>Lon: {row.geometry.x:.5f}<br>Lat: {row.geometry.y:.5f}"
-        controls_count = add_generic_point_layer(
-            m, filtered_controls, "TrafficControlsLayer", 'red', 4,
-            control_tooltip_generator, selected_types_tuple
-        )
+        filtered_controls = restrict_to_area(filtered_controls, street_area)
+        controls_count = add_point_layer_payload(point_layer_payloads, filtered_controls, build_traffic_controls_payload)
 
     # Collisions
+    collision_date_range = st.session_state.get(AppSessionStateKeys.LAST_RENDERED_COLLISION_DATE_RANGE)
+    collision_playback = st.session_state.get(AppSessionStateKeys.LAST_RENDERED_COLLISION_PLAYBACK, "Off")
+    playback_geojson = None
     show_collisions_layer = show_features and \
         (st.session_state.get(AppSessionStateKeys.LAST_RENDERED_COLLISION_YEARS) or \
-         st.session_state.get(AppSessionStateKeys.LAST_RENDERED_COLLISION_CHARACTERISTICS))
+         st.session_state.get(AppSessionStateKeys.LAST_RENDERED_COLLISION_CHARACTERISTICS) or \
+         collision_date_range or collision_playback != "Off")
     if show_collisions_layer:
         selected_years_tuple = tuple(sorted(st.session_state.get(AppSessionStateKeys.LAST_RENDERED_COLLISION_YEARS, [])))
         active_boolean_filters = {
             key: (key in st.session_state.get(AppSessionStateKeys.LAST_RENDERED_COLLISION_CHARACTERISTICS, []))
             for key in COLLISION_CHARACTERISTIC_FILTERS.keys()
         }
-        filtered_collisions = get_filtered_traffic_collisions_data(selected_years_tuple, active_boolean_filters)
-        def collision_tooltip_generator(row):
-            # Base info
-            tooltip_text = f"Year: {row.get('Year', 'N/A')}<br>Date: {str(row.get('ACCIDENT_D', 'N/A'))[:10]}"
-            
-            # Characteristics
-            char_cols = {
-                'NON_FATAL_': 'Non-Fatal', 'FATAL_INJU': 'Fatal/Injury', 'YOUNG_DEMO': 'Young Driver', 
-                'PEDESTRIAN': 'Pedestrian', 'AGRESSIVE_': 'Aggressive Driving', 'DISTRACTED': 'Distracted', 
-                'IMPAIRED_D': 'Impaired', 'BICYCLE_CO': 'Bicycle', 'INTERSECTI': 'Intersection'
-            }
-            
-            present_chars = []
-            for col, label in char_cols.items():
-                if str(row.get(col, 'N')).upper() in ['Y', 'YES']:
-                    present_chars.append(label)
-            
-            if present_chars:
-                tooltip_text += "<br>" + ", ".join(present_chars)
-                
-            # Coordinates
-            tooltip_text += f"<br>Lon: {row.geometry.x:.5f}<br>Lat: {row.geometry.y:.5f}"
-            
-            return tooltip_text
-        boolean_filter_names = sorted(st.session_state.get(AppSessionStateKeys.LAST_RENDERED_COLLISION_CHARACTERISTICS, []))
-        collision_layer_id_tuple = selected_years_tuple + tuple(boolean_filter_names) 
-        collisions_count = add_generic_point_layer(
-            m, filtered_collisions, "TrafficCollisionsLayer", 'orange', 3,
-            collision_tooltip_generator, collision_layer_id_tuple
-        )
+        if collision_date_range or collision_playback != "Off":
+            # Date ranges and playback go through the date-sorted timeline instead of whole year files
+            start_date, end_date = collision_date_range or (None, None)
+            active_characteristics_tuple = tuple(key for key, active in active_boolean_filters.items() if active)
+            if collision_playback != "Off":
+                playback_geojson = get_collision_playback_geojson(
+                    start_date, end_date, selected_years_tuple, active_characteristics_tuple, collision_playback, restrict_street
+                )
+                collisions_count = sum(len(feature['properties']['times']) for feature in playback_geojson['features'])
+            else:
+                filtered_collisions = get_collision_timeline().select(
+                    start_date, end_date, selected_years_tuple, active_characteristics_tuple, street_area
+                )
+                collisions_count = add_point_layer_payload(point_layer_payloads, filtered_collisions, build_collisions_payload)
+        else:
+            filtered_collisions = get_filtered_traffic_collisions_data(selected_years_tuple, active_boolean_filters)
+            filtered_collisions = restrict_to_area(filtered_collisions, street_area)
+            collisions_count = add_point_layer_payload(point_layer_payloads, filtered_collisions, build_collisions_payload)
 
     # Traffic Calming
     if show_features and st.session_state.get(AppSessionStateKeys.LAST_RENDERED_TRAFFIC_CALMING_ASSET_CODES):
         selected_asset_codes_tuple = tuple(sorted(st.session_state.get(AppSessionStateKeys.LAST_RENDERED_TRAFFIC_CALMING_ASSET_CODES, [])))
         filtered_traffic_calming = get_filtered_traffic_calming_data(selected_asset_codes_tuple)
-        def calming_tooltip_generator(row):
-            asset_code_key = row.get('ASSETCODE')
-            label = TRAFFIC_CALMING_ASSETCODE_LABELS.get(asset_code_key, asset_code_key) # Use key as fallback
-            return (f"Type: {label}<br>"
-                    f"Install Year: {row.get('INSTYR', 'N/A')}<br>"
-                    f"Location: {row.get('LOCATION', 'N/A')}<br>"
-                    f"Lon: {row.geometry.x:.5f}<br>"
-                    f"Lat: {row.geometry.y:.5f}")
-        traffic_calming_count = add_generic_point_layer(
-            m, filtered_traffic_calming, "TrafficCalmingLayer", 'teal', 3,
-            calming_tooltip_generator, selected_asset_codes_tuple
-        )
+        filtered_traffic_calming = restrict_to_area(filtered_traffic_calming, street_area)
+        traffic_calming_count = add_point_layer_payload(point_layer_payloads, filtered_traffic_calming, build_traffic_calming_payload)
 
     # Street Lights
     show_street_lights_layer = show_features and \
@@ -750,21 +1351,34 @@ with right_col:
         selected_uses_tuple = tuple(sorted(st.session_state.get(AppSessionStateKeys.LAST_RENDERED_STREET_LIGHT_USES, [])))
         selected_materials_tuple = tuple(sorted(st.session_state.get(AppSessionStateKeys.LAST_RENDERED_STREET_LIGHT_MATERIALS, [])))
         filtered_street_lights = get_filtered_street_lights_data(selected_uses_tuple, selected_materials_tuple)
-        def streetlight_tooltip_generator(row):
-            lightuse_code = row.get('LIGHTUSE', 'N/A')
-            lightuse_label = LIGHTUSE_LABELS.get(lightuse_code, lightuse_code)
-            return (f"Material: {row.get('MAT', 'N/A')}<br>"
-                    f"Use: {lightuse_label}<br>"
-                    f"Setback: {row.get('SETBACK', 'N/A')}<br>"
-                    f"Install Year: {row.get('INSTYR', 'N/A')}<br>"
-                    f"Lon: {row.geometry.x:.5f}<br>"
-                    f"Lat: {row.geometry.y:.5f}")
-        street_lights_layer_id_tuple = selected_uses_tuple + selected_materials_tuple
-        street_lights_count = add_generic_point_layer(
-            m, filtered_street_lights, "StreetLightsLayer", '#DAA520', 2.5,
-            streetlight_tooltip_generator, street_lights_layer_id_tuple
-        )
-        
+        filtered_street_lights = restrict_to_area(filtered_street_lights, street_area)
+        street_lights_count = add_point_layer_payload(point_layer_payloads, filtered_street_lights, build_street_lights_payload)
+
+    # One canvas layer per dataset so each keeps its own toggle in the layer control
+    for payload in point_layer_payloads:
+        FastPointLayer([payload], name=payload['name']).add_to(m)
+
+    # Collision playback: every frame is embedded once and stepped by the map's time control
+    if playback_geojson and playback_geojson['features']:
+        TimestampedGeoJson(
+            playback_geojson,
+            period=PLAYBACK_PERIODS[collision_playback][0],
+            duration=PLAYBACK_PERIODS[collision_playback][1],
+            auto_play=False,
+            add_last_point=False,
+            transition_time=500,
+            date_options="YYYY-MM-DD",
+        ).add_to(m)
+
+    # Outline of the current area selection (the client-side map must stay unchanged between reruns)
+    area_selection = st.session_state.get(AppSessionStateKeys.AREA_SELECTION)
+    if area_selection and not client_side_filtering:
+        folium.GeoJson(
+            shapely.geometry.mapping(shapely.from_wkt(area_selection)),
+            name="AreaSelectionLayer",
+            style_function=lambda feature: {'color': '#3388ff', 'weight': 2, 'fillOpacity': 0.05},
+        ).add_to(m)
+
     # Street Centrelines
     show_centrelines_layer = show_features and \
         (st.session_state.get(AppSessionStateKeys.LAST_RENDERED_CENTRELINE_BUCKETS) or \
@@ -773,6 +1387,7 @@ with right_col:
         selected_buckets_tuple = tuple(sorted(st.session_state.get(AppSessionStateKeys.LAST_RENDERED_CENTRELINE_BUCKETS, [])))
         selected_st_class_tuple = tuple(sorted(st.session_state.get(AppSessionStateKeys.LAST_RENDERED_CENTRELINE_ST_CLASS, [])))
         filtered_centrelines = get_filtered_centrelines_data(selected_buckets_tuple, selected_st_class_tuple)
+        filtered_centrelines = restrict_to_area(filtered_centrelines, street_area)
         if not filtered_centrelines.empty:
             fg = folium.FeatureGroup(name="StreetCentrelinesLayer", show=True)
             for _, row in filtered_centrelines.iterrows():
@@ -801,9 +1416,24 @@ with right_col:
         title_cancel="Exit Fullscreen",
         force_separate_button=False,
     ).add_to(m)
+    Draw(
+        position="topleft",
+        draw_options={'polyline': False, 'circle': False, 'marker': False, 'circlemarker': False, 'polygon': True, 'rectangle': True},
+        edit_options={'edit': False},
+    ).add_to(m)
     folium.LayerControl(position='topleft').add_to(m)
 
-    map_data = st_folium(m, width=900, height=600, returned_objects=['last_tile_layer'], key="folium_map")
+    map_data = st_folium(m, width=900, height=600, returned_objects=['last_tile_layer', 'last_active_drawing'], key="folium_map",
+                         center=map_center, zoom=map_zoom)
+
+    # A new polygon or rectangle drawn on the map becomes the area selection; the component keeps
+    # returning the last drawing, so only drawings not seen before replace the selection
+    last_drawing = map_data.get("last_active_drawing") if map_data else None
+    if last_drawing and last_drawing != st.session_state.get(AppSessionStateKeys.LAST_SEEN_DRAWING):
+        st.session_state[AppSessionStateKeys.LAST_SEEN_DRAWING] = last_drawing
+        drawn_geometry = shapely.geometry.shape(last_drawing['geometry'])
+        if drawn_geometry.geom_type == 'Polygon' and drawn_geometry.is_valid:
+            st.session_state[AppSessionStateKeys.AREA_SELECTION] = shapely.to_wkt(drawn_geometry, rounding_precision=6)
 
     # Only persist the user's last selected basemap if available (not None)
     if map_data and map_data.get("last_tile_layer") is not None:
@@ -830,10 +1460,69 @@ with right_col:
         stats_lines.append(f"- Street Lights: {street_lights_count}")
     if centrelines_count:
         stats_lines.append(f"- Street Centrelines: {centrelines_count}")
+    if client_side_filtering:
+        stats_lines = ["**Client-side filtering:** all datasets shipped once; counts are shown in the map panel."]
     st.markdown("\n".join(stats_lines))
 
     st.markdown(f"**Timing:** Data load: {load_end - load_start:.3f}s | Map init: {map_init_time:.3f}s | Filtering: {filter_end - filter_start:.3f}s | Map render: {map_render_time:.3f}s")
 
+    # --- Area selection statistics ---
+    area_selection = st.session_state.get(AppSessionStateKeys.AREA_SELECTION)
+    if area_selection:
+        get_area_statistics_index()
+        stats_start = time.time()
+        area_statistics = get_area_statistics(area_selection)
+        st.markdown(f"**Area selection statistics** (computed in {(time.time() - stats_start) * 1000:.1f} ms)")
+        for dataset_name, dataset_statistics in area_statistics.items():
+            value_column = "Km" if dataset_name == "Street Centrelines" else "Count"
+            with st.expander(f"{dataset_name}: {dataset_statistics['total']}"):
+                for title, rows in dataset_statistics['breakdowns'].items():
+                    st.dataframe(pd.DataFrame(rows, columns=[title, value_column]), hide_index=True)
+        if st.button("Clear selection"):
+            st.session_state[AppSessionStateKeys.AREA_SELECTION] = None
+            st.rerun()
+    else:
+        st.caption("Draw a polygon or rectangle on the map to see statistics for that area.")
+
+    # --- Collision breakdown sliced from the cube ---
+    with st.expander("Collision breakdown"):
+        collision_cube = get_collision_cube()
+        collision_cube.sync(get_available_collision_years())
+        if collision_cube.failed_years:
+            st.warning(
+                "Collision breakdown excludes years whose files could not be read: "
+                + ", ".join(f"{year} ({error})" for year, (_, error) in sorted(collision_cube.failed_years.items()))
+            )
+        breakdown_options = {"Year": 'Year', "Month": 'Month', **{label: column for column, label in COLLISION_CUBE_DIMENSIONS.items()}, "Characteristic": 'Characteristic'}
+        breakdown_label = st.selectbox("Break down by", list(breakdown_options), key="collision_breakdown_dimension")
+        split_label = st.selectbox("Split by", ["None"] + [label for label in breakdown_options if label != breakdown_label], key="collision_breakdown_split")
+        group_by = [breakdown_options[breakdown_label]]
+        if split_label != "None":
+            group_by.append(breakdown_options[split_label])
+        slice_start = time.time()
+        breakdown = collision_cube.slice(
+            group_by,
+            years=st.session_state.get(AppSessionStateKeys.LAST_RENDERED_COLLISION_YEARS, []),
+            characteristics=st.session_state.get(AppSessionStateKeys.LAST_RENDERED_COLLISION_CHARACTERISTICS, []),
+        )
+        slice_ms = (time.time() - slice_start) * 1000
+        breakdown = breakdown.rename(columns={column: label for label, column in breakdown_options.items()})
+        group_labels = [breakdown_label] + ([split_label] if split_label != "None" else [])
+        st.caption(f"Rendered collision years and characteristics (all collisions when none are rendered); sliced in {slice_ms:.1f} ms")
+        if breakdown.empty:
+            st.info("No collisions match the current selection.")
+        else:
+            time_axis = group_by[0] in ('Year', 'Month')
+            st.bar_chart(
+                breakdown,
+                x=group_labels[0],
+                y='Count',
+                color=group_labels[1] if len(group_labels) > 1 else None,
+                horizontal=not time_axis,
+                sort=False if time_axis else '-Count',
+            )
+            st.dataframe(breakdown, hide_index=True)
+
 # --- Script execution time (for debugging/performance monitoring) ---
 script_end = time.time()
 st.write(f"Total script execution time: {script_end - script_start:.3f}s") 
\ No newline at end of file
@@ -0,0 +1,371 @@
+"""
+Headless export of the viewer's filtered layers, without Streamlit.
+
+Takes the same selections as the filter form and writes GeoJSON, GeoParquet, CSV or a standalone
+map HTML. GeoJSON, GeoParquet and CSV rows are written in chunks, so memory stays bounded by the
+filtered layer being written rather than the size of the output; the map HTML is rendered whole.
+A batch file of many selections is exported in parallel across a process pool.
+Each output is written to a temporary path and only moved into place once complete, so a failed
+export is reported without leaving a partial file behind.
+
+Examples:
+    python export.py --junction-types 1 --years 2023 --characteristics young_driver -o junctions_2023.geojson
+    python export.py --light-uses ROW --light-materials ALUM --format csv -o street_lights_csv
+    python export.py --batch selections.json --workers 4
+
+A batch file is a JSON list of selections, for example:
+    [{"collision_years": [2023], "collision_characteristics": ["pedestrian_involved"],
+      "format": "geoparquet", "output": "exports/pedestrian_2023"}]
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+import folium
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from mobility_data import (
+    COLLISION_CHARACTERISTIC_FILTERS,
+    read_junctions_shapefile, read_traffic_controls_shapefile, read_traffic_calming_shapefile,
+    read_street_lights_shapefile, read_centrelines_shapefile, read_all_traffic_collisions,
+    filter_junctions, filter_traffic_controls, filter_traffic_calming, filter_street_lights,
+    filter_traffic_collisions, filter_centrelines, CollisionTimeline,
+)
+
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_FORMATS = ('geojson', 'geoparquet', 'csv', 'html')
+
+# Selection keys accepted in batch files, with their command-line flag, value type, allowed values
+# (None when any value is accepted) and help text
+SELECTION_FIELDS = {
+    'junction_types': ('--junction-types', int, None, "Junction type codes, e.g. 1 for intersections"),
+    'control_types': ('--control-types', int, None, "Traffic control type codes, e.g. 6 for signalized intersections"),
+    'collision_years': ('--years', int, None, "Collision years"),
+    'collision_characteristics': ('--characteristics', str, list(COLLISION_CHARACTERISTIC_FILTERS), "Collision characteristics, all required"),
+    'asset_codes': ('--asset-codes', str, None, "Traffic calming asset codes, e.g. SPDHMP"),
+    'light_uses': ('--light-uses', str, None, "Street light uses, e.g. ROW"),
+    'light_materials': ('--light-materials', str, None, "Street light materials, e.g. ALUM"),
+    'centreline_buckets': ('--centreline-buckets', str, None, "Street segment length buckets, e.g. 1–56m"),
+    'st_classes': ('--st-classes', str, None, "Street segment classes, e.g. ARTERIAL"),
+}
+BATCH_ENTRY_KEYS = {'output', 'format', 'collision_date_range', *SELECTION_FIELDS}
+
+# Same colours as the map layers in app.py
+LAYER_COLORS = {
+    "Junctions": 'blue',
+    "Traffic Controls": 'red',
+    "Collisions": 'orange',
+    "Traffic Calming": 'teal',
+    "Street Lights": '#DAA520',
+    "Street Centrelines": '#444',
+}
+
+# --- Dataset loading, once per process ---
+@lru_cache(maxsize=None)
+def load_dataset(name):
+    readers = {
+        'junctions': read_junctions_shapefile,
+        'traffic_controls': read_traffic_controls_shapefile,
+        'traffic_calming': read_traffic_calming_shapefile,
+        'street_lights': read_street_lights_shapefile,
+        'centrelines': read_centrelines_shapefile,
+        'collisions': read_all_traffic_collisions,
+    }
+    return readers[name]()
+
+@lru_cache(maxsize=None)
+def load_collision_timeline():
+    return CollisionTimeline(load_dataset('collisions'))
+
+def filter_collisions_for_selection(selection):
+    """
+    Applies the form's collision filters: years, required characteristics and an optional
+    inclusive (start, end) date range, which goes through the same timeline as the app.
+    """
+    selected_years_tuple = tuple(sorted(selection.get('collision_years', [])))
+    characteristics = selection.get('collision_characteristics', [])
+    date_range = selection.get('collision_date_range')
+    if date_range:
+        start_date, end_date = date_range
+        return load_collision_timeline().select(start_date, end_date, selected_years_tuple, tuple(characteristics))
+    active_boolean_filters = {key: key in characteristics for key in COLLISION_CHARACTERISTIC_FILTERS}
+    return filter_traffic_collisions(selected_years_tuple, active_boolean_filters)
+
+def iter_filtered_layers(selection):
+    """
+    Yields (layer name, GeoDataFrame) for each non-empty layer of a selection, one at a time.
+    A dataset is only loaded when at least one of its selection keys is set.
+    """
+    layer_filters = [
+        ("Junctions", ('junction_types',),
+         lambda: filter_junctions(load_dataset('junctions'), tuple(selection.get('junction_types', [])))),
+        ("Traffic Controls", ('control_types',),
+         lambda: filter_traffic_controls(load_dataset('traffic_controls'), tuple(selection.get('control_types', [])))),
+        ("Collisions", ('collision_years', 'collision_characteristics', 'collision_date_range'),
+         lambda: filter_collisions_for_selection(selection)),
+        ("Traffic Calming", ('asset_codes',),
+         lambda: filter_traffic_calming(load_dataset('traffic_calming'), tuple(selection.get('asset_codes', [])))),
+        ("Street Lights", ('light_uses', 'light_materials'),
+         lambda: filter_street_lights(load_dataset('street_lights'), tuple(selection.get('light_uses', [])), tuple(selection.get('light_materials', [])))),
+        ("Street Centrelines", ('centreline_buckets', 'st_classes'),
+         lambda: filter_centrelines(load_dataset('centrelines'), tuple(selection.get('centreline_buckets', [])), tuple(selection.get('st_classes', [])))),
+    ]
+    for layer_name, selection_keys, layer_filter in layer_filters:
+        if not any(selection.get(key) for key in selection_keys):
+            continue
+        gdf = layer_filter()
+        if not gdf.empty:
+            yield layer_name, gdf
+
+# --- Chunked writers ---
+def iter_chunks(gdf):
+    for start in range(0, len(gdf), EXPORT_CHUNK_SIZE):
+        yield gdf.iloc[start:start + EXPORT_CHUNK_SIZE]
+
+def layer_file_name(layer_name):
+    return layer_name.lower().replace(' ', '_')
+
+def json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    return str(value)
+
+def attribute_frame(chunk):
+    return pd.DataFrame(chunk.drop(columns=chunk.geometry.name))
+
+def write_geojson(layers, output_path):
+    """
+    Writes one FeatureCollection, feature by feature, with the source layer in a 'layer' property.
+    """
+    counts = {}
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        output_file.write('{"type": "FeatureCollection", "features": [\n')
+        separator = ''
+        for layer_name, gdf in layers:
+            if gdf.crs and gdf.crs.to_epsg() != 4326:
+                gdf = gdf.to_crs(epsg=4326)
+            for chunk in iter_chunks(gdf):
+                for feature in chunk.assign(layer=layer_name).iterfeatures(na='null', drop_id=True):
+                    output_file.write(separator + json.dumps(feature, default=json_default))
+                    separator = ',\n'
+            counts[layer_name] = len(gdf)
+        output_file.write('\n]}\n')
+    return counts
+
+def write_csv(layers, output_path):
+    """
+    Writes one CSV per layer into the output directory, with geometry as WKT.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    counts = {}
+    for layer_name, gdf in layers:
+        layer_path = os.path.join(output_path, f"{layer_file_name(layer_name)}.csv")
+        for i, chunk in enumerate(iter_chunks(gdf)):
+            attribute_frame(chunk).assign(geometry=chunk.geometry.to_wkt()).to_csv(
+                layer_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False
+            )
+        counts[layer_name] = len(gdf)
+    return counts
+
+def write_geoparquet(layers, output_path):
+    """
+    Writes one GeoParquet file per layer into the output directory, a row group per chunk.
+    The schema is taken from the whole layer so that chunks with only missing values still match.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    counts = {}
+    for layer_name, gdf in layers:
+        geometry_column = gdf.geometry.name
+        schema = pa.Schema.from_pandas(attribute_frame(gdf), preserve_index=False).append(pa.field(geometry_column, pa.binary()))
+        geo_metadata = {
+            'version': '1.0.0',
+            'primary_column': geometry_column,
+            'columns': {geometry_column: {
+                'encoding': 'WKB',
+                'geometry_types': sorted(gdf.geom_type.dropna().unique().tolist()),
+                'crs': gdf.crs.to_json_dict() if gdf.crs else None,
+            }},
+        }
+        schema = schema.with_metadata({**(schema.metadata or {}), b'geo': json.dumps(geo_metadata).encode('utf-8')})
+        with pq.ParquetWriter(os.path.join(output_path, f"{layer_file_name(layer_name)}.parquet"), schema) as writer:
+            for chunk in iter_chunks(gdf):
+                table = pa.Table.from_pandas(
+                    attribute_frame(chunk).assign(**{geometry_column: chunk.geometry.to_wkb().to_numpy()}),
+                    schema=schema, preserve_index=False
+                )
+                writer.write_table(table)
+        counts[layer_name] = len(gdf)
+    return counts
+
+def write_map_html(layers, output_path):
+    """
+    Writes a standalone Leaflet map with one toggleable layer per dataset.
+    """
+    m = folium.Map(location=[44.649605, -63.592300], zoom_start=13)
+    counts = {}
+    for layer_name, gdf in layers:
+        color = LAYER_COLORS.get(layer_name, 'gray')
+        folium.GeoJson(
+            gdf[[gdf.geometry.name]],
+            name=f"{layer_name} ({len(gdf)})",
+            marker=folium.CircleMarker(radius=3, weight=1, fill=True, fill_opacity=0.8),
+            style_function=lambda feature, color=color: {'color': color, 'fillColor': color, 'weight': 2},
+            tooltip=layer_name,
+        ).add_to(m)
+        counts[layer_name] = len(gdf)
+    folium.LayerControl().add_to(m)
+    m.save(output_path)
+    return counts
+
+WRITERS = {
+    'geojson': write_geojson,
+    'geoparquet': write_geoparquet,
+    'csv': write_csv,
+    'html': write_map_html,
+}
+
+def replace_output(temp_path, output_path, temp_dir):
+    """
+    Moves a finished file or directory into place. An existing output directory is first moved
+    into temp_dir, since a directory can only replace an empty one.
+    """
+    if os.path.isdir(temp_path) and os.path.isdir(output_path):
+        os.replace(output_path, os.path.join(temp_dir, "previous"))
+    os.replace(temp_path, output_path)
+
+def export_selection(selection, output_format, output_path):
+    """
+    Exports one selection and returns (output path, row count per layer).
+    The writer fills a temporary file or directory next to output_path, which replaces output_path
+    only once it is complete, so a failed export never leaves a truncated output behind.
+    """
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(output_path)}.", dir=output_dir)
+    try:
+        temp_path = os.path.join(temp_dir, os.path.basename(output_path))
+        counts = WRITERS[output_format](iter_filtered_layers(selection), temp_path)
+        replace_output(temp_path, output_path, temp_dir)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return output_path, counts
+
+# --- Command line ---
+def parse_date_range(start_date, end_date):
+    """
+    Validates an inclusive collision date range; either end may be None to leave it open.
+    """
+    try:
+        start, end = (datetime.date.fromisoformat(value) if value else None for value in (start_date, end_date))
+    except (TypeError, ValueError):
+        raise ValueError(f"Collision dates must be YYYY-MM-DD, got {start_date!r} to {end_date!r}")
+    if start and end and start > end:
+        raise ValueError(f"Collision start date {start_date} is after end date {end_date}")
+    return [start_date, end_date]
+
+def parse_selection(args):
+    selection = {key: getattr(args, key) for key in SELECTION_FIELDS if getattr(args, key)}
+    if args.start_date or args.end_date:
+        selection['collision_date_range'] = parse_date_range(args.start_date, args.end_date)
+    return selection
+
+def parse_batch_entry(entry):
+    """
+    Validates one batch entry and returns (selection, format, output path). Unknown keys and values
+    are rejected rather than ignored, so a typo never exports an unfiltered or empty layer.
+    """
+    if not isinstance(entry, dict) or 'output' not in entry:
+        raise ValueError(f"Batch entry {entry!r} needs an 'output'")
+    output = entry['output']
+    unknown_keys = sorted(set(entry) - BATCH_ENTRY_KEYS)
+    if unknown_keys:
+        raise ValueError(f"Unknown keys {unknown_keys} for output '{output}'; expected some of {sorted(BATCH_ENTRY_KEYS)}")
+    output_format = entry.get('format', 'geojson')
+    if output_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{output_format}' for output '{output}'")
+    selection = {}
+    for key, (_, value_type, choices, _) in SELECTION_FIELDS.items():
+        if key not in entry:
+            continue
+        values = entry[key]
+        if not isinstance(values, list) or not all(isinstance(value, value_type) for value in values):
+            raise ValueError(f"'{key}' for output '{output}' must be a list of {value_type.__name__} values")
+        unknown_values = [value for value in values if choices is not None and value not in choices]
+        if unknown_values:
+            raise ValueError(f"Unknown {key} {unknown_values} for output '{output}'; expected some of {choices}")
+        selection[key] = values
+    if 'collision_date_range' in entry:
+        date_range = entry['collision_date_range']
+        if not isinstance(date_range, list) or len(date_range) != 2:
+            raise ValueError(f"'collision_date_range' for output '{output}' must be [start, end]")
+        selection['collision_date_range'] = parse_date_range(*date_range)
+    return selection, output_format, os.path.abspath(output)
+
+def load_batch(path):
+    """
+    Reads a JSON list of selections; each needs an 'output' and may set 'format' (default geojson).
+    """
+    with open(path, encoding='utf-8') as batch_file:
+        entries = json.load(batch_file)
+    return [parse_batch_entry(entry) for entry in entries]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export filtered Halifax mobility layers without Streamlit.")
+    for key, (flag, value_type, choices, help_text) in SELECTION_FIELDS.items():
+        parser.add_argument(flag, dest=key, nargs='+', type=value_type, choices=choices, default=[], help=help_text)
+    parser.add_argument('--start-date', help="First collision date (YYYY-MM-DD), inclusive")
+    parser.add_argument('--end-date', help="Last collision date (YYYY-MM-DD), inclusive")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='geojson',
+                        help="Output format; csv and geoparquet write one file per layer into the output directory")
+    parser.add_argument('-o', '--output', help="Output file, or directory for csv/geoparquet")
+    parser.add_argument('--batch', help="JSON file with a list of selections to export in parallel")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes for --batch")
+    parser.add_argument('--data-dir', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="Folder holding the dataset folders (defaults to this script's folder)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.batch:
+            jobs = load_batch(args.batch)
+        elif args.output:
+            jobs = [(parse_selection(args), args.format, os.path.abspath(args.output))]
+        else:
+            parser.error("either --output or --batch is required")
+    except ValueError as exc:
+        parser.error(str(exc))
+    # Output paths are resolved first; the dataset paths in mobility_data are relative to the data folder
+    os.chdir(args.data_dir)
+
+    failures = 0
+    if len(jobs) == 1:
+        try:
+            output_path, counts = export_selection(*jobs[0])
+            print(f"{output_path}: {counts}")
+        except Exception as exc:
+            failures += 1
+            print(f"{jobs[0][2]}: failed ({exc})", file=sys.stderr)
+        return 1 if failures else 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(export_selection, *job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                output_path, counts = future.result()
+                print(f"{output_path}: {counts}")
+            except Exception as exc:
+                failures += 1
+                print(f"{futures[future][2]}: failed ({exc})", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+Concurrent-session load test for the Streamlit app, built on Streamlit's AppTest.
+
+Simulates N sessions in one process, so they share the app's st.cache_data/st.cache_resource
+caches the way sessions on one server instance do. Each session repeats a realistic sequence of
+filter, render, search, area selection and breakdown reruns. The report records p50/p95 rerun
+latency per step, skipped steps, peak RSS and st.cache_data growth as JSON, and can be compared against
+an earlier report. Streamlit only sizes st.cache_data entries; st.cache_resource objects show up in RSS
+instead. RSS is sampled from /proc on Linux; elsewhere only the kernel's peak RSS is available.
+
+Examples:
+    python load_test.py --sessions 8 --iterations 3 -o report.json
+    python load_test.py --sessions 8 --iterations 3 -o report_new.json --compare report.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import streamlit
+from streamlit.runtime.caching import get_data_cache_stats_provider
+from streamlit.testing.v1 import AppTest
+
+from mobility_data import JUNCTION_TYPE_LABELS, LIGHTUSE_LABELS, COLLISION_CHARACTERISTIC_FILTERS, get_available_collision_years
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Area selection used by the scenario: a box around downtown Halifax
+AREA_SELECTION_WKT = "POLYGON ((-63.6 44.64, -63.57 44.64, -63.57 44.66, -63.6 44.66, -63.6 44.64))"
+STREET_SEARCH_QUERIES = ["barrington st", "quinpool", "spring garden", "portland st"]
+# Form multiselects the scenario fills: widget key -> (raw option values to pick from, session key
+# the app copies the selection into on Render). AppTest shows options as formatted labels, but
+# set_value() takes raw values.
+FORM_FILTERS = {
+    "junction_type_multiselect": (lambda: list(JUNCTION_TYPE_LABELS), 'last_rendered_junction_types'),
+    "traffic_collision_year_multiselect": (get_available_collision_years, 'last_rendered_collision_years'),
+    "collision_characteristic_multiselect": (lambda: list(COLLISION_CHARACTERISTIC_FILTERS), 'last_rendered_collision_characteristics'),
+    "street_light_use_multiselect": (lambda: list(LIGHTUSE_LABELS), 'last_rendered_street_light_uses'),
+}
+
+# --- Measurements ---
+def peak_rss_mb():
+    """
+    Returns the kernel's peak RSS for this process; ru_maxrss is in kilobytes on Linux but bytes on macOS.
+    """
+    if resource is None:
+        return 0.0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 2**20 if sys.platform == 'darwin' else max_rss / 1024
+
+def current_rss_mb():
+    """
+    Returns the current RSS from /proc on Linux, or the peak RSS so far where /proc is not available.
+    """
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+class RssSampler(threading.Thread):
+    """
+    Samples resident memory while the sessions run; the kernel's max RSS covers spikes between samples.
+    """
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_mb = current_rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return max(self.peak_mb, peak_rss_mb())
+
+def cache_data_bytes():
+    """
+    Returns {"st_cache_data:<function>": bytes} for every st.cache_data cache. st.cache_resource
+    entries are left out: Streamlit does not size them, so their memory is only visible in RSS.
+    """
+    sizes = {}
+    for family_stats in get_data_cache_stats_provider().get_stats().values():
+        for stat in family_stats:
+            key = f"{stat.category_name}:{stat.cache_name}"
+            sizes[key] = sizes.get(key, 0) + stat.byte_length
+    return sizes
+
+def latency_summary(seconds):
+    milliseconds = np.asarray(seconds) * 1000
+    return {
+        'count': int(len(milliseconds)),
+        'p50': round(float(np.percentile(milliseconds, 50)), 1),
+        'p95': round(float(np.percentile(milliseconds, 95)), 1),
+        'max': round(float(milliseconds.max()), 1),
+    }
+
+# --- Session scenario ---
+def find_widget(widgets, key):
+    return next((widget for widget in widgets if widget.key == key), None)
+
+def find_button(at, label):
+    return next((button for button in at.button if button.label == label), None)
+
+def pick(options, session_index, count=1):
+    options = list(options)
+    return [options[(session_index + i) % len(options)] for i in range(min(count, len(options)))]
+
+def raw_options(multiselect, candidates):
+    """
+    Returns the candidate raw values that the app offers in `multiselect`, matched through its format_func.
+    """
+    offered = set(multiselect.options)
+    values = []
+    for value in candidates:
+        try:
+            if multiselect.format_func(value) in offered:
+                values.append(value)
+        except Exception:
+            continue
+    return values
+
+def rendered_points(at):
+    for markdown in at.markdown:
+        match = re.search(r"Total data points rendered:\*\* (\d+)", markdown.value)
+        if match:
+            return int(match.group(1))
+    return None
+
+def fill_form(at, session_index, counts):
+    """
+    Sets each form multiselect in `counts` (widget key -> values to pick) that is on the page and
+    clicks Render. Returns a check for after the rerun, or False when no field or no Render button is there.
+    """
+    render_button = find_button(at, "Render")
+    expected = {}
+    for widget_key, count in counts.items():
+        multiselect = find_widget(at.multiselect, widget_key)
+        candidates, last_rendered_key = FORM_FILTERS[widget_key]
+        values = pick(raw_options(multiselect, candidates()), session_index, count) if multiselect is not None else []
+        if values:
+            multiselect.set_value(values)
+            expected[last_rendered_key] = values
+    if render_button is None or not expected:
+        return False
+    render_button.click()
+
+    def check_render(at):
+        for last_rendered_key, values in expected.items():
+            rendered = at.session_state[last_rendered_key] if last_rendered_key in at.session_state else None
+            if sorted(rendered or []) != sorted(values):
+                return f"{last_rendered_key} is {rendered!r} after Render, expected {values!r}"
+        if not rendered_points(at):
+            return "Render showed no data points"
+        return None
+    return check_render
+
+def scenario_steps(session_index):
+    """
+    Returns (step name, action) pairs; an action prepares widgets on the AppTest before its rerun.
+    It returns False when the widgets it needs are not on the page, so the step is recorded as
+    skipped, and may return a check that inspects the AppTest after the rerun and returns an error.
+    """
+    def filter_and_render(at):
+        return fill_form(at, session_index, {
+            "junction_type_multiselect": 2,
+            "traffic_collision_year_multiselect": 1,
+            "street_light_use_multiselect": 1,
+        })
+
+    def add_characteristic(at):
+        return fill_form(at, session_index, {"collision_characteristic_multiselect": 1})
+
+    def search_street(at):
+        search_input = find_widget(at.text_input, "street_search_query")
+        if search_input is None:
+            return False
+        search_input.input(STREET_SEARCH_QUERIES[session_index % len(STREET_SEARCH_QUERIES)])
+
+    def select_area(at):
+        at.session_state['area_selection'] = AREA_SELECTION_WKT
+
+    def collision_breakdown(at):
+        breakdown = find_widget(at.selectbox, "collision_breakdown_dimension")
+        if breakdown is None:
+            return False
+        breakdown.select(pick(breakdown.options, session_index)[0])
+
+    def set_client_side(value):
+        def action(at):
+            toggle = find_widget(at.toggle, "client_side_filtering")
+            if toggle is None:
+                return False
+            toggle.set_value(value)
+        return action
+
+    def clear_map(at):
+        clear_button = find_button(at, "Clear Map")
+        if clear_button is None:
+            return False
+        clear_button.click()
+
+    return [
+        ("filter_and_render", filter_and_render),
+        ("add_characteristic", add_characteristic),
+        ("search_street", search_street),
+        ("select_area", select_area),
+        ("collision_breakdown", collision_breakdown),
+        ("client_side_on", set_client_side(True)),
+        ("client_side_off", set_client_side(False)),
+        ("clear_map", clear_map),
+    ]
+
+def run_session(app_path, session_index, iterations, timeout, start_barrier, results):
+    """
+    Runs one simulated session and appends (step, seconds, error) tuples to results;
+    a skipped step is recorded with neither seconds nor error, and a failed check without seconds.
+    """
+    at = AppTest.from_file(app_path, default_timeout=timeout)
+    start_barrier.wait()
+    steps = [("initial_load", None)] + scenario_steps(session_index) * iterations
+    for step_name, action in steps:
+        try:
+            check = action(at) if action is not None else None
+            if check is False:
+                results.append((step_name, None, None))
+                continue
+            step_start = time.perf_counter()
+            at.run()
+            elapsed = time.perf_counter() - step_start
+            error = "; ".join(str(exception.message) for exception in at.exception) or None
+            if error is None and check is not None:
+                error = check(at)
+                if error is not None:
+                    # A rerun that did not do what the step asked for is not a representative timing
+                    elapsed = None
+        except Exception as exc:
+            elapsed, error = None, f"{type(exc).__name__}: {exc}"
+        results.append((step_name, elapsed, error))
+
+# --- Report ---
+def app_version(data_dir):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=data_dir, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=data_dir, capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def build_report(args, results, wall_seconds, rss_start_mb, rss_peak_mb, caches_start, caches_end):
+    step_latencies = {}
+    skipped = {}
+    for step_name, elapsed, error in results:
+        if elapsed is not None:
+            step_latencies.setdefault(step_name, []).append(elapsed)
+        elif error is None:
+            skipped[step_name] = skipped.get(step_name, 0) + 1
+    all_latencies = [elapsed for latencies in step_latencies.values() for elapsed in latencies]
+    errors = [{'step': step_name, 'error': error} for step_name, _, error in results if error]
+    return {
+        'app_version': app_version(args.data_dir),
+        'streamlit_version': streamlit.__version__,
+        'python_version': platform.python_version(),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'config': {'sessions': args.sessions, 'iterations': args.iterations},
+        'wall_seconds': round(wall_seconds, 2),
+        'latency_ms': {
+            'all': latency_summary(all_latencies) if all_latencies else None,
+            'steps': {step_name: latency_summary(latencies) for step_name, latencies in step_latencies.items()},
+        },
+        'errors': {'count': len(errors), 'first': errors[:10]},
+        'skipped_steps': skipped,
+        'rss_mb': {'start': round(rss_start_mb, 1), 'peak': round(rss_peak_mb, 1), 'growth': round(rss_peak_mb - rss_start_mb, 1)},
+        'cache_data_bytes': {
+            'start': caches_start,
+            'end': caches_end,
+            'growth': sum(caches_end.values()) - sum(caches_start.values()),
+        },
+    }
+
+def report_metrics(report):
+    metrics = {
+        'p50 ms (all)': report['latency_ms']['all']['p50'] if report['latency_ms']['all'] else None,
+        'p95 ms (all)': report['latency_ms']['all']['p95'] if report['latency_ms']['all'] else None,
+    }
+    for step_name, summary in report['latency_ms']['steps'].items():
+        metrics[f"p95 ms ({step_name})"] = summary['p95']
+    metrics['peak RSS MB'] = report['rss_mb']['peak']
+    metrics['cache_data growth MB'] = round(report['cache_data_bytes']['growth'] / 2**20, 1)
+    metrics['errors'] = report['errors']['count']
+    metrics['skipped steps'] = sum(report['skipped_steps'].values())
+    return metrics
+
+def print_report(report, baseline=None):
+    print(f"app {report['app_version']} | streamlit {report['streamlit_version']} | "
+          f"{report['config']['sessions']} sessions x {report['config']['iterations']} iterations | {report['wall_seconds']}s")
+    metrics = report_metrics(report)
+    baseline_metrics = report_metrics(baseline) if baseline else {}
+    if baseline:
+        print(f"compared with app {baseline['app_version']} ({baseline['config']['sessions']} sessions x {baseline['config']['iterations']} iterations)")
+    for name, value in metrics.items():
+        line = f"  {name:<32} {value!s:>10}"
+        old_value = baseline_metrics.get(name)
+        if isinstance(value, (int, float)) and isinstance(old_value, (int, float)):
+            line += f"  (was {old_value}, {value - old_value:+.1f})"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent sessions of the Streamlit app and report rerun latency and memory.")
+    parser.add_argument('--sessions', type=int, default=4, help="Number of concurrent sessions")
+    parser.add_argument('--iterations', type=int, default=2, help="Times each session repeats the scenario")
+    parser.add_argument('--timeout', type=float, default=300, help="Seconds allowed for a single rerun")
+    parser.add_argument('--data-dir', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="Folder holding app.py and the dataset folders (defaults to this script's folder)")
+    parser.add_argument('-o', '--output', help="Write the JSON report here")
+    parser.add_argument('--compare', help="Earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+    args.data_dir = os.path.abspath(args.data_dir)
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+    # The app reads its datasets through paths relative to its folder
+    os.chdir(args.data_dir)
+
+    results = []
+    start_barrier = threading.Barrier(args.sessions)
+    sessions = [
+        threading.Thread(
+            target=run_session,
+            args=(os.path.join(args.data_dir, "app.py"), i, args.iterations, args.timeout, start_barrier, results),
+            name=f"load-test-session-{i}",
+        )
+        for i in range(args.sessions)
+    ]
+    caches_start = cache_data_bytes()
+    rss_start_mb = current_rss_mb()
+    sampler = RssSampler()
+    sampler.start()
+    wall_start = time.perf_counter()
+    for session in sessions:
+        session.start()
+    for session in sessions:
+        session.join()
+    wall_seconds = time.perf_counter() - wall_start
+    rss_peak_mb = sampler.stop()
+
+    report = build_report(args, results, wall_seconds, rss_start_mb, rss_peak_mb, caches_start, cache_data_bytes())
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=2)
+    print_report(report, baseline)
+    return 1 if report['errors']['count'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
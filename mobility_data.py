@@ -0,0 +1,663 @@
+"""
+Dataset loading, filtering and in-memory indexes for the Halifax Urban Mobility Data Viewer, without Streamlit.
+app.py wraps these functions and classes in Streamlit caches; export.py uses them directly.
+"""
+import os
+import re
+import calendar
+import threading
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# --- Label dictionaries for UI and popups ---
+JUNCTION_TYPE_LABELS = {
+    0: "Non‐Intersection Junction",
+    1: "Intersection",
+    2: "Dead End",
+    3: "Ferry Route Connection",
+    4: "Outer Boundary Point",
+    5: "Boulevard"
+}
+TRAFFIC_CONTROL_TYPE_LABELS = {
+    1: "Intersection",
+    6: "Signalized Intersection",
+    7: "RA‐5 with Flashing Beacon",
+    8: "Overhead Flashing Beacon",
+    9: "RA‐5 without Flashing Beacon",
+    10: "Rectangular Rapid Flashing Beacon",
+    11: "Roundabout",
+    12: "Lane Control",
+    13: "All Way Stop",
+    14: "Pedestrian Half Signals",
+    15: "Median Mounted Flashing Beacon"
+}
+TRAFFIC_CALMING_ASSETCODE_LABELS = {
+    "SPDHMP": "Speed Humps",
+    "SPDTBL": "Speed Tables",
+    "RSDINT": "Raised Intersections",
+    "RSDCRW": "Raised Crosswalks",
+    "SPDCSH": "Speed Cushions",
+    "BMPOUT": "Concrete curb variations: Bump-outs",
+    "CTRMED": "Concrete curb variations: Centre Island Medians",
+    "CHICAN": "Concrete curb variations: Chicanes",
+    "BUSPTF": "Bus Platforms",
+    "BUSBMP": "Bus Stop Bump Outs / Bus Bulb",
+    "TRFCIR": "Traffic Circle"
+}
+
+LIGHTUSE_LABELS = {
+    "ROW": "ROW Street Light",
+    "PRIV": "Private Light",
+    "AREA": "Area Light",
+    "FLOOD": "Flood Light",
+    "PARK": "Park Light",
+    "PARKING": "Parking Lot Light",
+    "WALKWAY": "Walkway Light",
+    "BOARDWALK": "Boardwalk Light"
+}
+
+# --- Collision characteristic filter keys and their column names ---
+COLLISION_CHARACTERISTIC_FILTERS = {
+    'non_fatal': 'NON_FATAL_',
+    'fatal_injury': 'FATAL_INJU',
+    'young_driver': 'YOUNG_DEMO',
+    'pedestrian_involved': 'PEDESTRIAN',
+    'aggressive_driving': 'AGRESSIVE_',
+    'distracted_driving': 'DISTRACTED',
+    'impaired_driving': 'IMPAIRED_D',
+    'bicycle_collision': 'BICYCLE_CO',
+    'intersection_related': 'INTERSECTI'
+}
+
+# --- Data loading functions for all datasets ---
+def read_junctions_shapefile():
+    gdf = gpd.read_file("Street junctions/Street_Junctions_trimmed.shp")
+    if gdf.crs and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    return gdf
+
+def read_traffic_controls_shapefile():
+    gdf = gpd.read_file("traffic control locations/Traffic_Control_Locations_trimmed.shp")
+    if gdf.crs and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    return gdf
+
+def read_traffic_calming_shapefile():
+    gdf = gpd.read_file("Traffic calming infrastructure/Traffic_Calming_Infrastructure_trimmed.shp")
+    if gdf.crs and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    return gdf
+
+def read_street_lights_shapefile():
+    gdf = gpd.read_file("streetlights/Street_Lights_trimmed.shp")
+    if gdf.crs and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    for col in ['LIGHTUSE', 'MAT', 'SETBACK']:
+        if col in gdf.columns:
+            gdf[col] = gdf[col].replace('', 'UNKN').fillna('UNKN')
+    return gdf
+
+def read_centrelines_shapefile():
+    gdf = gpd.read_file("street centrelines/Street_Network_trimmed.shp")
+    gdf.columns = [col.lower() for col in gdf.columns]
+    # Project to UTM zone 20N (EPSG:26920) for accurate length in meters
+    gdf_metric = gdf.to_crs(epsg=26920)
+    gdf['length_m'] = gdf_metric.length
+    # Back to WGS84 for Folium
+    if gdf.crs and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    bins = [0, 56, 90, 117, 150, 195, 251, 331, 450, 708, 42587]
+    labels = [f"{bins[i]+1}–{bins[i+1]}m" for i in range(10)]
+    gdf['length_bucket'] = pd.cut(gdf['length_m'], bins=bins, labels=labels, include_lowest=True, right=True)
+    return gdf
+
+# --- Collision data: available years and loading by year ---
+def get_available_collision_years():
+    folder = "traffic_collisions_by_year"
+    years = []
+    if not os.path.exists(folder) or not os.path.isdir(folder):
+        return years
+    for fname in os.listdir(folder):
+        if fname.startswith("collisions_") and fname.endswith(".shp"):
+            try:
+                year_str = fname.replace("collisions_", "").replace(".shp", "")
+                if year_str.isdigit():
+                    years.append(int(year_str))
+            except ValueError:
+                pass
+    years.sort()
+    return years
+
+def read_all_traffic_collisions():
+    """
+    Loads every available collision year into a single GeoDataFrame.
+    The 'Year' column is taken from the file name so it matches the year filter.
+    """
+    frames = []
+    for year in get_available_collision_years():
+        path = os.path.join("traffic_collisions_by_year", f"collisions_{year}.shp")
+        if os.path.exists(path):
+            try:
+                df = gpd.read_file(path)
+                df['Year'] = year
+                frames.append(df)
+            except Exception:
+                pass
+    if not frames:
+        return gpd.GeoDataFrame()
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True))
+
+# --- Filter functions for each dataset ---
+def filter_junctions(junctions_gdf, selected_junction_types_tuple):
+    if not selected_junction_types_tuple:
+        return gpd.GeoDataFrame()
+    return junctions_gdf[junctions_gdf['JUNCTION_T'].isin(selected_junction_types_tuple)]
+
+def filter_traffic_controls(traffic_controls_gdf, selected_traffic_control_types_tuple):
+    if not selected_traffic_control_types_tuple or 'CONTROL_TY' not in traffic_controls_gdf.columns:
+        return gpd.GeoDataFrame()
+    return traffic_controls_gdf[traffic_controls_gdf['CONTROL_TY'].isin(selected_traffic_control_types_tuple)]
+
+def filter_traffic_calming(traffic_calming_gdf, selected_asset_codes_tuple):
+    if not selected_asset_codes_tuple or 'ASSETCODE' not in traffic_calming_gdf.columns:
+        return gpd.GeoDataFrame()
+    return traffic_calming_gdf[traffic_calming_gdf['ASSETCODE'].isin(selected_asset_codes_tuple)]
+
+def filter_street_lights(street_lights_gdf, selected_lightuse_tuple, selected_material_tuple):
+    if not selected_lightuse_tuple and not selected_material_tuple:
+        return gpd.GeoDataFrame()
+    
+    data_to_filter = street_lights_gdf
+
+    if selected_lightuse_tuple:
+        if 'LIGHTUSE' not in data_to_filter.columns: return gpd.GeoDataFrame()
+        data_to_filter = data_to_filter[data_to_filter['LIGHTUSE'].isin(selected_lightuse_tuple)]
+    
+    if selected_material_tuple:
+        if 'MAT' not in data_to_filter.columns: return gpd.GeoDataFrame()
+        data_to_filter = data_to_filter[data_to_filter['MAT'].isin(selected_material_tuple)]
+
+    return data_to_filter
+
+def filter_traffic_collisions(selected_years_tuple, active_boolean_filters):
+    current_data_frames = []
+    base_data_loaded = False
+    if selected_years_tuple:
+        for year in selected_years_tuple:
+            path = os.path.join("traffic_collisions_by_year", f"collisions_{year}.shp")
+            if os.path.exists(path):
+                try:
+                    df = gpd.read_file(path)
+                    if 'Year' not in df.columns and 'ACCIDENT_D' in df.columns:
+                        df['Year'] = pd.to_datetime(df['ACCIDENT_D'], errors='coerce').dt.year
+                        df.dropna(subset=['Year'], inplace=True)
+                        df['Year'] = df['Year'].astype(int)
+                    current_data_frames.append(df)
+                except Exception:
+                    pass
+        if current_data_frames:
+            base_data_loaded = True
+    elif any(active_boolean_filters.values()):
+        for year in get_available_collision_years():
+            path = os.path.join("traffic_collisions_by_year", f"collisions_{year}.shp")
+            if os.path.exists(path):
+                try:
+                    df = gpd.read_file(path)
+                    if 'Year' not in df.columns and 'ACCIDENT_D' in df.columns:
+                        df['Year'] = pd.to_datetime(df['ACCIDENT_D'], errors='coerce').dt.year
+                        df.dropna(subset=['Year'], inplace=True)
+                        df['Year'] = df['Year'].astype(int)
+                    current_data_frames.append(df)
+                except Exception:
+                    pass
+        if current_data_frames:
+            base_data_loaded = True
+    if not base_data_loaded:
+        return gpd.GeoDataFrame()
+    final_data = gpd.GeoDataFrame(pd.concat(current_data_frames, ignore_index=True)) if current_data_frames else gpd.GeoDataFrame()
+    if final_data.empty:
+        return gpd.GeoDataFrame()
+    if any(active_boolean_filters.values()):
+        for filter_key, column_name in COLLISION_CHARACTERISTIC_FILTERS.items():
+            if active_boolean_filters.get(filter_key, False):
+                if column_name in final_data.columns:
+                    condition = final_data[column_name].fillna('N').astype(str).str.upper().isin(['Y', 'YES'])
+                    final_data = final_data[condition]
+                    if final_data.empty:
+                        return gpd.GeoDataFrame()
+    return final_data
+
+def filter_centrelines(centrelines_gdf, selected_buckets_tuple, selected_st_class_tuple):
+    if not selected_buckets_tuple and not selected_st_class_tuple:
+        return gpd.GeoDataFrame()
+    
+    # Initial data to filter
+    data_to_filter = centrelines_gdf
+
+    # Apply filters if they are provided
+    if selected_buckets_tuple:
+        if 'length_bucket' not in data_to_filter.columns: return gpd.GeoDataFrame()
+        data_to_filter = data_to_filter[data_to_filter['length_bucket'].isin(selected_buckets_tuple)]
+    
+    if selected_st_class_tuple:
+        if 'st_class' not in data_to_filter.columns: return gpd.GeoDataFrame()
+        data_to_filter = data_to_filter[data_to_filter['st_class'].isin(selected_st_class_tuple)]
+
+    return data_to_filter
+
+# --- Shared column helpers ---
+def drop_missing_geometries(gdf):
+    if gdf.empty:
+        return gdf
+    return gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+
+def optional_column(gdf, column_name):
+    if column_name in gdf.columns:
+        return gdf[column_name]
+    return pd.Series('N/A', index=gdf.index)
+
+def factorize_column(series):
+    """
+    Returns (codes, uniques) for a column, with missing values coded as 'N/A'.
+    Categorical columns keep their declared category order (e.g. length buckets).
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        if series.isna().any():
+            series = series.cat.add_categories('N/A').fillna('N/A')
+        return series.cat.codes.to_numpy(), series.cat.categories
+    values = series.astype(object).where(series.notna(), 'N/A')
+    return pd.factorize(values, sort=True)
+
+COLLISION_CHARACTERISTIC_LABELS = [key.replace('_', ' ').title() for key in COLLISION_CHARACTERISTIC_FILTERS.keys()]
+
+def collision_characteristic_bitmask(gdf):
+    """
+    Packs the Y/N collision characteristic columns into one uint16 bitmask per row.
+    Bit order follows COLLISION_CHARACTERISTIC_FILTERS.
+    """
+    mask = np.zeros(len(gdf), dtype=np.uint16)
+    for bit, column_name in enumerate(COLLISION_CHARACTERISTIC_FILTERS.values()):
+        if column_name in gdf.columns:
+            flags = gdf[column_name].fillna('N').astype(str).str.upper().isin(['Y', 'YES']).to_numpy()
+            mask |= flags.astype(np.uint16) << bit
+    return mask
+
+def count_bitmask_bits(mask, bit_count):
+    return [int(((mask >> bit) & 1).sum()) for bit in range(bit_count)]
+
+# --- Street/location search index ---
+STREET_PROXIMITY_METERS = 30
+
+def normalize_street_name(value):
+    """
+    Upper-cases a street/location string and drops house numbers and parenthesised notes.
+    """
+    text = re.sub(r"\(.*?\)", " ", str(value).upper()).strip()
+    text = re.sub(r"^\d+[A-Z]?\s+", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def split_location_names(value):
+    """
+    Splits compound locations such as 'SOUTH ST - WELLINGTON ST' or 'OLD SACKVILLE RD/WALKER AVE'.
+    """
+    if pd.isna(value):
+        return []
+    names = (normalize_street_name(part) for part in re.split(r"\s+-\s+|/", str(value)))
+    return [name for name in names if len(name) > 1]
+
+def street_name_trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def zoom_for_bounds(bounds, width_px=900, height_px=600, max_zoom=18):
+    """
+    Returns the highest Web Mercator zoom level at which the bounds fit in the map viewport.
+    """
+    minx, miny, maxx, maxy = bounds
+    def mercator_y(lat):
+        sin = np.sin(np.radians(lat))
+        return 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * np.pi)
+    span_x = max((maxx - minx) / 360, 1e-9)
+    span_y = max(abs(mercator_y(maxy) - mercator_y(miny)), 1e-9)
+    zoom = np.floor(np.log2(0.9 * min(width_px / (256 * span_x), height_px / (256 * span_y))))
+    return int(np.clip(zoom, 3, max_zoom))
+
+class StreetSearchIndex:
+    """
+    In-memory index over the street and location names of every dataset.
+    Exact and prefix matches come from a sorted name list; fuzzy matches are ranked by
+    trigram overlap (Dice coefficient) using trigram -> name id posting arrays.
+    """
+    def __init__(self, sources):
+        # sources: list of (dataset name, GeoDataFrame, name columns)
+        rows_by_name = {}
+        self.geometries = {}
+        feature_bounds = {}
+        for dataset_name, gdf, name_columns in sources:
+            if gdf.empty:
+                continue
+            self.geometries[dataset_name] = gdf.geometry.values
+            feature_bounds[dataset_name] = gdf.geometry.bounds.to_numpy()
+            for column in name_columns:
+                if column not in gdf.columns:
+                    continue
+                # Normalise each distinct raw value once, then map its rows through it
+                codes, uniques = pd.factorize(gdf[column])
+                order = np.argsort(codes, kind='stable')
+                boundaries = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+                for code, raw_value in enumerate(uniques):
+                    positions = order[boundaries[code]:boundaries[code + 1]]
+                    for name in split_location_names(raw_value):
+                        rows_by_name.setdefault(name, {}).setdefault(dataset_name, []).append(positions)
+
+        self.names = sorted(rows_by_name)
+        self.rows = []
+        self.bounds = np.empty((len(self.names), 4))
+        trigram_ids = {}
+        self.trigram_counts = np.empty(len(self.names))
+        for name_id, name in enumerate(self.names):
+            rows = {dataset: np.unique(np.concatenate(chunks)) for dataset, chunks in rows_by_name[name].items()}
+            self.rows.append(rows)
+            stacked = np.vstack([feature_bounds[dataset][positions] for dataset, positions in rows.items()])
+            self.bounds[name_id] = [np.nanmin(stacked[:, 0]), np.nanmin(stacked[:, 1]),
+                                    np.nanmax(stacked[:, 2]), np.nanmax(stacked[:, 3])]
+            trigrams = street_name_trigrams(name)
+            self.trigram_counts[name_id] = len(trigrams)
+            for trigram in trigrams:
+                trigram_ids.setdefault(trigram, []).append(name_id)
+        self.trigram_postings = {trigram: np.array(ids, dtype=np.int32) for trigram, ids in trigram_ids.items()}
+
+    def search(self, query, limit=8, min_score=0.35):
+        """
+        Returns up to `limit` matches as dicts with name, score, bounds and per-dataset feature counts.
+        """
+        query = normalize_street_name(query)
+        if not query or not self.names:
+            return []
+        scores = np.zeros(len(self.names))
+        query_trigrams = street_name_trigrams(query)
+        hits = [self.trigram_postings[t] for t in query_trigrams if t in self.trigram_postings]
+        if hits:
+            shared = np.bincount(np.concatenate(hits), minlength=len(self.names))
+            scores = 2.0 * shared / (len(query_trigrams) + self.trigram_counts)
+        # Prefix matches always rank above fuzzy ones, and an exact match above both
+        start = bisect_left(self.names, query)
+        end = bisect_left(self.names, query + "\uffff")
+        scores[start:end] += 1.0
+        if start < len(self.names) and self.names[start] == query:
+            scores[start] += 1.0
+        candidates = np.flatnonzero(scores >= min_score)
+        best = candidates[np.argsort(-scores[candidates], kind='stable')][:limit]
+        return [
+            {
+                'name': self.names[name_id],
+                'score': float(scores[name_id]),
+                'bounds': self.bounds[name_id].tolist(),
+                'counts': {dataset: len(positions) for dataset, positions in self.rows[name_id].items()},
+            }
+            for name_id in best
+        ]
+
+    def area(self, name, distance_m=STREET_PROXIMITY_METERS):
+        """
+        Returns the WGS84 polygon covering every feature indexed under `name`, buffered by `distance_m`.
+        """
+        name_id = bisect_left(self.names, name)
+        if name_id >= len(self.names) or self.names[name_id] != name:
+            return None
+        geometries = np.concatenate([self.geometries[dataset][positions] for dataset, positions in self.rows[name_id].items()])
+        merged = gpd.GeoSeries([shapely.union_all(geometries)], crs="EPSG:4326")
+        return merged.to_crs(epsg=26920).buffer(distance_m).to_crs(epsg=4326).iloc[0]
+
+# --- Area selection statistics ---
+class AreaStatisticsIndex:
+    """
+    Spatially indexed datasets with precomputed attribute codes for polygon statistics.
+    A query is one STRtree lookup per dataset followed by np.bincount over the stored codes;
+    centreline lengths are clipped to the polygon in UTM 20N before being summed per class.
+    """
+    def __init__(self, point_sources, centrelines):
+        # point_sources: list of (dataset name, GeoDataFrame, breakdowns); a breakdown is
+        # (title, column, label_func), or (title, None, None) for the collision characteristic bitmask
+        self.point_datasets = []
+        for dataset_name, gdf, breakdowns in point_sources:
+            gdf = drop_missing_geometries(gdf)
+            if gdf.empty:
+                continue
+            entry = {'name': dataset_name, 'sindex': gdf.sindex, 'breakdowns': []}
+            for title, column, label_func in breakdowns:
+                if column is None:
+                    entry['breakdowns'].append((title, 'bits', collision_characteristic_bitmask(gdf), COLLISION_CHARACTERISTIC_LABELS))
+                elif column in gdf.columns:
+                    codes, uniques = factorize_column(gdf[column])
+                    entry['breakdowns'].append((title, 'coded', codes, [label_func(value) for value in uniques]))
+            self.point_datasets.append(entry)
+
+        centrelines = drop_missing_geometries(centrelines)
+        self.centreline_sindex = centrelines.sindex
+        self.centreline_metric = centrelines.geometry.to_crs(epsg=26920).values
+        self.centreline_lengths = centrelines['length_m'].to_numpy()
+        if 'st_class' in centrelines.columns:
+            self.centreline_codes, self.centreline_classes = factorize_column(centrelines['st_class'])
+        else:
+            self.centreline_codes, self.centreline_classes = np.zeros(len(centrelines), dtype=np.int64), ['N/A']
+
+    def query(self, polygon):
+        """
+        Returns {dataset name: {'total': n, 'breakdowns': {title: [(label, value), ...]}}}.
+        """
+        results = {}
+        for entry in self.point_datasets:
+            positions = entry['sindex'].query(polygon, predicate='intersects')
+            breakdowns = {}
+            for title, kind, values, labels in entry['breakdowns']:
+                if kind == 'bits':
+                    counts = count_bitmask_bits(values[positions], len(labels))
+                else:
+                    counts = np.bincount(values[positions], minlength=len(labels)).tolist()
+                rows = sorted(((labels[i], int(c)) for i, c in enumerate(counts) if c), key=lambda row: -row[1])
+                breakdowns[title] = rows
+            results[entry['name']] = {'total': int(len(positions)), 'breakdowns': breakdowns}
+
+        positions = self.centreline_sindex.query(polygon, predicate='intersects')
+        polygon_metric = gpd.GeoSeries([polygon], crs="EPSG:4326").to_crs(epsg=26920).iloc[0]
+        geometries = self.centreline_metric[positions]
+        inside = shapely.within(geometries, polygon_metric)
+        lengths = self.centreline_lengths[positions].copy()
+        lengths[~inside] = shapely.length(shapely.intersection(geometries[~inside], polygon_metric))
+        km_by_class = np.bincount(self.centreline_codes[positions], weights=lengths, minlength=len(self.centreline_classes)) / 1000
+        rows = sorted(((self.centreline_classes[i], round(float(km), 2)) for i, km in enumerate(km_by_class) if km > 0), key=lambda row: -row[1])
+        results["Street Centrelines"] = {'total': int(len(positions)), 'breakdowns': {"Class": rows}}
+        return results
+
+# --- Collision timeline: date-sorted index ---
+# Collisions in the 1899 file carry the spreadsheet zero date instead of their real date
+PLACEHOLDER_COLLISION_DATE = pd.Timestamp('1899-12-30')
+
+class CollisionTimeline:
+    """
+    All dated collisions sorted by ACCIDENT_D, with the dates kept as a datetime64[D] index.
+    A date range resolves by binary search to one contiguous slice of the sorted rows.
+    """
+    def __init__(self, collisions_gdf):
+        dates = pd.to_datetime(optional_column(collisions_gdf, 'ACCIDENT_D'), errors='coerce')
+        dated = drop_missing_geometries(collisions_gdf[dates.notna() & (dates != PLACEHOLDER_COLLISION_DATE)])
+        order = np.argsort(dates[dated.index].to_numpy(), kind='stable')
+        self.gdf = dated.iloc[order].reset_index(drop=True)
+        self.days = dates[dated.index].to_numpy()[order].astype('datetime64[D]')
+        self.characteristics = collision_characteristic_bitmask(self.gdf)
+        self.years = optional_column(self.gdf, 'Year').to_numpy()
+
+    @property
+    def first_date(self):
+        return self.days[0].item() if len(self.days) else None
+
+    @property
+    def last_date(self):
+        return self.days[-1].item() if len(self.days) else None
+
+    def positions(self, start_date=None, end_date=None, years=(), characteristics=(), area=None):
+        """
+        Returns the row positions dated start_date..end_date (inclusive) that are in one of
+        the years (when given), have every listed characteristic and intersect `area` (when given).
+        """
+        lo = 0 if start_date is None else int(np.searchsorted(self.days, np.datetime64(start_date, 'D'), side='left'))
+        hi = len(self.days) if end_date is None else int(np.searchsorted(self.days, np.datetime64(end_date, 'D'), side='right'))
+        if hi <= lo:
+            return np.arange(0, dtype=np.int64)
+        keep = np.ones(hi - lo, dtype=bool)
+        if years:
+            keep &= np.isin(self.years[lo:hi], list(years))
+        required_bits = 0
+        for bit, key in enumerate(COLLISION_CHARACTERISTIC_FILTERS.keys()):
+            if key in characteristics:
+                required_bits |= 1 << bit
+        if required_bits:
+            keep &= (self.characteristics[lo:hi] & required_bits) == required_bits
+        if area is not None:
+            in_area = np.zeros(len(self.days), dtype=bool)
+            in_area[self.gdf.sindex.query(area, predicate='intersects')] = True
+            keep &= in_area[lo:hi]
+        return lo + np.flatnonzero(keep)
+
+    def select(self, start_date=None, end_date=None, years=(), characteristics=(), area=None):
+        return self.gdf.iloc[self.positions(start_date, end_date, years, characteristics, area)]
+
+def playback_frame_starts(days, playback):
+    """
+    Returns the first day of the playback frame holding each datetime64[D] day: the Monday of its
+    week for "Weekly", the first of its month otherwise.
+    """
+    if playback == "Weekly":
+        # 1970-01-01 was a Thursday, so (days + 3) % 7 is the weekday counted from Monday
+        day_numbers = days.astype(np.int64)
+        return (day_numbers - (day_numbers + 3) % 7).astype('datetime64[D]')
+    return days.astype('datetime64[M]').astype('datetime64[D]')
+
+# --- Collision OLAP cube ---
+COLLISION_CUBE_DIMENSIONS = {
+    'LIGHT_COND': "Light condition",
+    'WEATHER_CO': "Weather",
+    'ROAD_SURFA': "Road surface",
+    'ROAD_CONFI': "Road configuration",
+    'COLLISION1': "Collision type",
+    'ROAD_ALIGN': "Road alignment",
+}
+MONTH_LABELS = ["Unknown"] + list(calendar.month_abbr[1:])
+
+class CollisionCube:
+    """
+    Collision counts grouped by year x month x COLLISION_CUBE_DIMENSIONS x characteristic bitmask.
+    Only non-empty cells are kept, as small integer codes with one partition per year file, so a
+    new year file is grouped on its own and appended. Dimension labels are shared by all partitions.
+    """
+    def __init__(self):
+        self.labels = {column: [] for column in COLLISION_CUBE_DIMENSIONS}
+        self._label_codes = {column: {} for column in COLLISION_CUBE_DIMENSIONS}
+        self.partitions = {}
+        # Year -> (file modification time, error) for year files that could not be read; they are
+        # retried only once the file changes
+        self.failed_years = {}
+        self._cells = None
+        self._lock = threading.Lock()
+
+    def _encode(self, column, df):
+        labels, label_codes = self.labels[column], self._label_codes[column]
+        if column not in df.columns:
+            values = pd.Series('N/A', index=df.index)
+        else:
+            values = df[column].astype(object).where(df[column].notna(), 'N/A').astype(str)
+        for value in pd.unique(values):
+            if value not in label_codes:
+                label_codes[value] = len(labels)
+                labels.append(value)
+        return values.map(label_codes).to_numpy(np.uint16)
+
+    def add_year(self, year, df):
+        months = pd.to_datetime(df['ACCIDENT_D'], errors='coerce').dt.month if 'ACCIDENT_D' in df.columns else pd.Series(np.nan, index=df.index)
+        cells = pd.DataFrame({'Month': months.fillna(0).to_numpy(np.uint8)})
+        for column in COLLISION_CUBE_DIMENSIONS:
+            cells[column] = self._encode(column, df)
+        cells['Characteristics'] = collision_characteristic_bitmask(df)
+        partition = cells.groupby(list(cells.columns), sort=False).size().reset_index(name='Count')
+        partition['Count'] = partition['Count'].astype(np.uint32)
+        partition.insert(0, 'Year', np.uint16(year))
+        self.partitions[year] = partition
+        self._cells = None
+
+    def sync(self, years):
+        """
+        Groups any year file not yet in the cube and drops years whose file has gone.
+        Years whose file cannot be read are kept in failed_years.
+        """
+        with self._lock:
+            for year in [year for year in self.partitions if year not in years]:
+                del self.partitions[year]
+                self._cells = None
+            for year in [year for year in self.failed_years if year not in years]:
+                del self.failed_years[year]
+            for year in years:
+                if year in self.partitions:
+                    continue
+                path = os.path.join("traffic_collisions_by_year", f"collisions_{year}.shp")
+                modified = os.path.getmtime(path) if os.path.exists(path) else None
+                if year in self.failed_years and self.failed_years[year][0] == modified:
+                    continue
+                try:
+                    self.add_year(year, gpd.read_file(path, ignore_geometry=True))
+                    self.failed_years.pop(year, None)
+                except Exception as exc:
+                    self.failed_years[year] = (modified, str(exc))
+            if self._cells is None:
+                frames = [self.partitions[year] for year in sorted(self.partitions)]
+                self._cells = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['Year', 'Month', *COLLISION_CUBE_DIMENSIONS, 'Characteristics', 'Count'])
+            return self._cells
+
+    def slice(self, group_by, years=(), characteristics=(), filters=None):
+        """
+        Sums the cube over everything except the group_by dimensions ('Year', 'Month', a
+        COLLISION_CUBE_DIMENSIONS column or 'Characteristic'). Years and dimension filters keep
+        cells matching any listed value; characteristics keep cells having all listed flags.
+        """
+        # sync() rebuilds the cells under the lock, so reading them under it never sees a rebuild in progress
+        with self._lock:
+            cells = self._cells
+        if cells is None or cells.empty:
+            return pd.DataFrame(columns=[*group_by, 'Count'])
+        keep = np.ones(len(cells), dtype=bool)
+        if years:
+            keep &= cells['Year'].isin(years).to_numpy()
+        required_bits = 0
+        for bit, key in enumerate(COLLISION_CHARACTERISTIC_FILTERS.keys()):
+            if key in characteristics:
+                required_bits |= 1 << bit
+        if required_bits:
+            keep &= (cells['Characteristics'].to_numpy() & required_bits) == required_bits
+        for column, values in (filters or {}).items():
+            codes = [self._label_codes[column][value] for value in values if value in self._label_codes[column]]
+            keep &= cells[column].isin(codes).to_numpy()
+        cells = cells[keep]
+
+        if 'Characteristic' in group_by:
+            # Each collision counts once under every characteristic it has
+            others = [column for column in group_by if column != 'Characteristic']
+            frames = []
+            for bit, label in enumerate(COLLISION_CHARACTERISTIC_LABELS):
+                flagged = cells[((cells['Characteristics'].to_numpy() >> bit) & 1).astype(bool)]
+                frame = flagged.groupby(others, sort=True)['Count'].sum().reset_index() if others else pd.DataFrame({'Count': [flagged['Count'].sum()]})
+                frame['Characteristic'] = label
+                frames.append(frame)
+            result = pd.concat(frames, ignore_index=True)
+        else:
+            result = cells.groupby(list(group_by), sort=True)['Count'].sum().reset_index()
+        result = result[result['Count'] > 0]
+        for column in group_by:
+            if column == 'Month':
+                result[column] = [MONTH_LABELS[code] for code in result[column]]
+            elif column in COLLISION_CUBE_DIMENSIONS:
+                result[column] = [self.labels[column][code] for code in result[column]]
+        result['Count'] = result['Count'].astype(int)
+        return result[[*group_by, 'Count']].reset_index(drop=True)
@@ -0,0 +1,145 @@
+"""
+Tests for the Streamlit-free collision timeline and cube in mobility_data.py.
+
+Run with: python -m pytest -q
+"""
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point
+
+import mobility_data
+from mobility_data import CollisionCube, CollisionTimeline, playback_frame_starts
+
+
+def collisions_frame(rows):
+    """
+    Builds a collision GeoDataFrame from (date, year, weather, set of characteristic keys) rows.
+    """
+    records = []
+    for i, (date, year, weather, characteristics) in enumerate(rows):
+        record = {'ACCIDENT_D': date, 'Year': year, 'WEATHER_CO': weather}
+        for key, column_name in mobility_data.COLLISION_CHARACTERISTIC_FILTERS.items():
+            record[column_name] = 'Y' if key in characteristics else 'N'
+        record['geometry'] = Point(-63.59 + i * 0.001, 44.65)
+        records.append(record)
+    return gpd.GeoDataFrame(records, geometry='geometry', crs="EPSG:4326")
+
+
+def write_year_file(year, rows):
+    os.makedirs("traffic_collisions_by_year", exist_ok=True)
+    collisions_frame(rows).to_file(os.path.join("traffic_collisions_by_year", f"collisions_{year}.shp"))
+
+
+# --- CollisionCube.sync ---
+def test_sync_adds_new_years_and_drops_removed_ones(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_year_file(2022, [('2022-01-05', 2022, 'Clear', set())])
+    write_year_file(2023, [('2023-02-01', 2023, 'Clear', set()), ('2023-02-02', 2023, 'Rain', set())])
+    cube = CollisionCube()
+
+    cube.sync([2022])
+    assert cube.slice(['Year']).to_dict('records') == [{'Year': 2022, 'Count': 1}]
+
+    cube.sync([2022, 2023])
+    assert cube.slice(['Year']).to_dict('records') == [{'Year': 2022, 'Count': 1}, {'Year': 2023, 'Count': 2}]
+
+    cube.sync([2023])
+    assert sorted(cube.partitions) == [2023]
+    assert cube.slice(['Year']).to_dict('records') == [{'Year': 2023, 'Count': 2}]
+
+
+def test_sync_retries_a_failed_year_only_after_its_file_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("traffic_collisions_by_year")
+    path = os.path.join("traffic_collisions_by_year", "collisions_2024.shp")
+    with open(path, 'w') as broken_file:
+        broken_file.write("not a shapefile")
+    reads = []
+    read_file = gpd.read_file
+    monkeypatch.setattr(mobility_data.gpd, 'read_file', lambda *args, **kwargs: reads.append(args[0]) or read_file(*args, **kwargs))
+    cube = CollisionCube()
+
+    cube.sync([2024])
+    assert list(cube.failed_years) == [2024]
+    cube.sync([2024])
+    assert len(reads) == 1
+
+    os.remove(path)
+    write_year_file(2024, [('2024-03-01', 2024, 'Clear', set())])
+    modified = os.path.getmtime(path) + 10
+    os.utime(path, (modified, modified))
+    cube.sync([2024])
+    assert len(reads) == 2
+    assert cube.failed_years == {}
+    assert cube.slice(['Year']).to_dict('records') == [{'Year': 2024, 'Count': 1}]
+
+
+# --- CollisionCube.slice ---
+def test_slice_counts_a_collision_under_every_characteristic_it_has():
+    cube = CollisionCube()
+    cube.add_year(2023, collisions_frame([
+        ('2023-01-10', 2023, 'Clear', {'young_driver', 'pedestrian_involved'}),
+        ('2023-01-11', 2023, 'Clear', {'young_driver'}),
+        ('2023-02-01', 2023, 'Rain', set()),
+    ]))
+    cube.sync([2023])
+
+    counts = dict(cube.slice(['Characteristic']).itertuples(index=False))
+    assert counts == {'Young Driver': 2, 'Pedestrian Involved': 1}
+
+    by_month = cube.slice(['Characteristic', 'Month'], characteristics=['young_driver']).to_dict('records')
+    # Characteristics follow the COLLISION_CHARACTERISTIC_FILTERS order
+    assert by_month == [
+        {'Characteristic': 'Young Driver', 'Month': 'Jan', 'Count': 2},
+        {'Characteristic': 'Pedestrian Involved', 'Month': 'Jan', 'Count': 1},
+    ]
+    assert cube.slice(['Year']).to_dict('records') == [{'Year': 2023, 'Count': 3}]
+
+
+# --- CollisionTimeline ---
+@pytest.fixture
+def timeline():
+    return CollisionTimeline(collisions_frame([
+        ('2023-03-02', 2023, 'Clear', set()),
+        ('1899-12-30', 1899, 'Clear', set()),
+        ('2023-03-01', 2023, 'Clear', {'fatal_injury'}),
+        ('2023-03-03', 2023, 'Clear', set()),
+        ('2024-01-01', 2024, 'Clear', {'fatal_injury'}),
+        (None, 2023, 'Clear', set()),
+    ]))
+
+
+def selected_dates(timeline, *args, **kwargs):
+    return [str(day) for day in timeline.days[timeline.positions(*args, **kwargs)]]
+
+
+def test_timeline_drops_placeholder_and_missing_dates(timeline):
+    assert selected_dates(timeline) == ['2023-03-01', '2023-03-02', '2023-03-03', '2024-01-01']
+
+
+def test_positions_include_both_ends_of_the_date_range(timeline):
+    assert selected_dates(timeline, '2023-03-01', '2023-03-02') == ['2023-03-01', '2023-03-02']
+    assert selected_dates(timeline, '2023-03-02', None) == ['2023-03-02', '2023-03-03', '2024-01-01']
+    assert selected_dates(timeline, None, '2023-03-01') == ['2023-03-01']
+    assert selected_dates(timeline, '2023-03-03', '2023-03-01') == []
+
+
+def test_positions_filter_years_and_characteristics(timeline):
+    assert selected_dates(timeline, years=(2024,)) == ['2024-01-01']
+    assert selected_dates(timeline, '2023-01-01', '2024-12-31', characteristics=('fatal_injury',)) == ['2023-03-01', '2024-01-01']
+
+
+def test_weekly_frames_start_on_monday():
+    days = np.array(['2024-01-01', '2024-01-03', '2024-01-07', '2024-01-08', '1969-12-31'], dtype='datetime64[D]')
+    frame_starts = playback_frame_starts(days, "Weekly")
+    assert [str(day) for day in frame_starts] == ['2024-01-01', '2024-01-01', '2024-01-01', '2024-01-08', '1969-12-29']
+    assert all(pd.Timestamp(day).dayofweek == 0 for day in frame_starts)
+
+
+def test_monthly_frames_start_on_the_first():
+    days = np.array(['2024-02-29', '2024-03-01', '2023-12-31'], dtype='datetime64[D]')
+    assert [str(day) for day in playback_frame_starts(days, "Monthly")] == ['2024-02-01', '2024-03-01', '2023-12-01']